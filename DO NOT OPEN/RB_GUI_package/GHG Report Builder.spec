@@ -5,7 +5,7 @@ a = Analysis(
     ['report_builder_gui.pyw'],
     pathex=[],
     binaries=[],
-    datas=[('icon/ghg-rep-builder.ico', 'icon'), ('icon/ghg-rep-builder.png', 'icon')],
+    datas=[('icon/ghg-rep-builder.ico', 'icon'), ('icon/ghg-rep-builder.png', 'icon'), ('report_mapping.json', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
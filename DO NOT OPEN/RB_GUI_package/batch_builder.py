@@ -0,0 +1,229 @@
+# Batch front end for report_builder: builds many reports from one Word template
+# on a process pool and writes a per-job summary.
+#
+# Usage:
+#   python batch_builder.py --template template.docx --output-dir out --manifest jobs.csv
+#   python batch_builder.py --template template.docx --output-dir out --input-dir inventories/
+#
+# A manifest is either a CSV with the columns excel_path,output_name or a JSON
+# list of {"excel_path": ..., "output_name": ...} objects (a JSON object mapping
+# excel_path -> output_name also works). Relative excel paths are resolved
+# against the manifest's folder. With --input-dir every .xlsx in the folder is
+# built into <workbook name>.docx. Only the first job per report path is built;
+# later ones with the same output name are reported as errors in the summary.
+#
+# --timings-dir writes every job's per-stage timings (build_instrumentation) to
+# <output name>.timings.csv there; --profile-stage also captures one stage with
+# cProfile or tracemalloc into <output name>-profiles/.
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import report_builder
+from build_instrumentation import PROFILE_MODES, BuildInstrumentation, StageReport
+from report_plan import DEFAULT_MAPPING_PATH
+from report_template import TEMPLATE_CACHE
+
+SUMMARY_FIELDS = ['excel_path', 'output_path', 'status', 'duration_s', 'error']
+
+
+def _docx_name(name):
+    return name if name.lower().endswith('.docx') else name + '.docx'
+
+
+def load_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = [{'excel_path': k, 'output_name': v} for k, v in entries.items()]
+    else:
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    jobs = []
+    for entry in entries:
+        excel_path = (entry.get('excel_path') or '').strip()
+        if not excel_path:
+            continue
+        output_name = (entry.get('output_name') or '').strip()
+        if not output_name:
+            output_name = os.path.splitext(os.path.basename(excel_path))[0]
+        jobs.append((os.path.join(base_dir, excel_path), _docx_name(output_name)))
+    return jobs
+
+
+def jobs_from_directory(input_dir):
+    jobs = []
+    for name in sorted(os.listdir(input_dir)):
+        # Skip Excel's ~$ lock files
+        if name.lower().endswith('.xlsx') and not name.startswith('~$'):
+            jobs.append((os.path.join(input_dir, name), _docx_name(os.path.splitext(name)[0])))
+    return jobs
+
+
+def _duplicate_outputs(jobs, output_folder):
+    # {job index: excel path of the earlier job writing the same report} for
+    # every job after the first one per output path; two jobs on one path would
+    # overwrite each other's .docx and build manifest. Paths compare the way the
+    # file system does (case-insensitively on Windows).
+    first = {}
+    duplicates = {}
+    for idx, (_, output_name) in enumerate(jobs):
+        key = os.path.normcase(os.path.abspath(os.path.join(output_folder, output_name)))
+        if key in first:
+            duplicates[idx] = jobs[first[key]][0]
+        else:
+            first[key] = idx
+    return duplicates
+
+
+def _error_result(excel_path, output_folder, output_name, error):
+    return {
+        'excel_path': excel_path,
+        'output_path': os.path.join(output_folder, output_name),
+        'status': 'error',
+        'duration_s': '',
+        'error': error,
+    }
+
+
+def _init_worker(word_path):
+    # Parse and compile the template once per worker process. Jobs already use
+    # every core, so each one reads its sheets and fills its tables in-process
+    # instead of on sheet or render pools.
+    report_builder.SHEET_WORKERS = 1
+    TEMPLATE_CACHE.open(word_path)
+
+
+def _job_instrumentation(output_folder, output_name, timings_dir, profile_stage, profile):
+    # (BuildInstrumentation, StageReport) for one job, or (None, None) when not asked for
+    if timings_dir is None and profile_stage is None:
+        return None, None
+    stem = os.path.splitext(output_name)[0]
+    report = StageReport()
+    profile_dir = os.path.join(timings_dir or output_folder, f"{stem}-profiles")
+    return BuildInstrumentation([report], profile_stage, profile, profile_dir), report
+
+
+def _run_job(excel_path, word_path, output_folder, output_name, mapping_path=DEFAULT_MAPPING_PATH, incremental=True,
+             timings_dir=None, profile_stage=None, profile='cprofile'):
+    started = time.perf_counter()
+    instrumentation, report = _job_instrumentation(output_folder, output_name, timings_dir, profile_stage, profile)
+    result = {
+        'excel_path': excel_path,
+        'output_path': os.path.join(output_folder, output_name),
+        'status': 'ok',
+        'duration_s': None,
+        'error': '',
+    }
+    try:
+        report_builder.main_with_inputs(excel_path, word_path, output_folder, output_name, mapping_path, incremental,
+                                        instrumentation)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    if report is not None and timings_dir is not None:
+        os.makedirs(timings_dir, exist_ok=True)
+        report.write(os.path.join(timings_dir, f"{os.path.splitext(output_name)[0]}.timings.csv"))
+    result['duration_s'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(jobs, word_path, output_folder, workers=None, on_result=None, mapping_path=DEFAULT_MAPPING_PATH,
+              incremental=True, timings_dir=None, profile_stage=None, profile='cprofile'):
+    # Returns one summary dict per job, in job order. A job whose report path an
+    # earlier job already writes is not built and reports an error instead.
+    os.makedirs(output_folder, exist_ok=True)
+    results = [None] * len(jobs)
+    duplicates = _duplicate_outputs(jobs, output_folder)
+    for idx, earlier in duplicates.items():
+        excel_path, output_name = jobs[idx]
+        results[idx] = _error_result(excel_path, output_folder, output_name,
+                                     f"Duplicate output: {output_name} is already built from {earlier}")
+        if on_result is not None:
+            on_result(results[idx])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(word_path,)) as pool:
+        futures = {
+            pool.submit(_run_job, excel_path, word_path, output_folder, output_name, mapping_path, incremental,
+                        timings_dir, profile_stage, profile): idx
+            for idx, (excel_path, output_name) in enumerate(jobs)
+            if idx not in duplicates
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # worker died (e.g. out of memory)
+                excel_path, output_name = jobs[idx]
+                result = _error_result(excel_path, output_folder, output_name, f"{type(e).__name__}: {e}")
+            results[idx] = result
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def write_summary(results, summary_path):
+    if summary_path.lower().endswith('.json'):
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        return
+    with open(summary_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build GHG reports in parallel from many Excel inventories.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="CSV/JSON manifest of excel_path -> output_name")
+    source.add_argument('--input-dir', help="Folder of .xlsx inventories, one report per workbook")
+    parser.add_argument('--template', required=True, help="Word template (.docx)")
+    parser.add_argument('--output-dir', required=True, help="Folder for the generated reports")
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING_PATH, help="Report layout mapping (.json)")
+    parser.add_argument('--full-rebuild', action='store_true',
+                        help="Rebuild every report from scratch instead of updating only what changed")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--summary', default=None,
+                        help="Summary file, .csv or .json (default: <output-dir>/batch_summary.csv)")
+    parser.add_argument('--timings-dir', default=None, help="Write per-stage timings of every job to this folder")
+    parser.add_argument('--profile-stage', default=None,
+                        help="Capture this stage (e.g. fill_table, read_sheet, save) of every job in detail")
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, default='cprofile',
+                        help="How --profile-stage is captured (default: cprofile)")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest) if args.manifest else jobs_from_directory(args.input_dir)
+    if not jobs:
+        print("No workbooks to build.")
+        return 0
+
+    def report(result):
+        print(f"[{result['status']}] {result['excel_path']} ({result['duration_s']}s) {result['error']}")
+
+    started = time.perf_counter()
+    results = run_batch(jobs, args.template, args.output_dir, args.workers, on_result=report,
+                        mapping_path=args.mapping, incremental=not args.full_rebuild,
+                        timings_dir=args.timings_dir, profile_stage=args.profile_stage, profile=args.profile_mode)
+    summary_path = args.summary or os.path.join(args.output_dir, 'batch_summary.csv')
+    write_summary(results, summary_path)
+
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    print(f"{len(results) - failed}/{len(results)} reports built in "
+          f"{time.perf_counter() - started:.1f}s; summary at {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # PyInstaller builds on Windows
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# Per-stage timing and memory events for report builds. main_with_inputs and
+# run_plan wrap each stage (template, plan, sheet reads, every table fill,
+# placeholders, save, ...) in BuildInstrumentation.stage(); subscribers get a
+# 'start' and an 'end' StageEvent per stage, the end one carrying wall time, CPU
+# time and how much the process's peak RSS grew during the stage.
+#
+#   report = StageReport()
+#   instrumentation = BuildInstrumentation([report, print])
+#   main_with_inputs(..., instrumentation=instrumentation)
+#   report.write('timings.csv')           # or .json
+#
+# One stage can also be captured in detail: profile_stage='fill_table' with
+# profile='cprofile' writes a .prof per occurrence (open with pstats or
+# snakeviz), profile='tracemalloc' the top allocation sites as text.
+
+import cProfile
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+TRACEMALLOC_TOP = 30
+
+# Columns of a StageReport CSV; stage attributes not listed here go to 'details'
+REPORT_FIELDS = ['stage', 'sheet', 'table', 'index', 'rows', 'wall_s', 'cpu_s', 'peak_rss_delta_bytes',
+                 'peak_rss_bytes', 'error', 'details']
+
+
+def _windows_peak_rss():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes, None where unavailable
+    try:
+        if sys.platform == 'win32':
+            return _windows_peak_rss()
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes on Linux
+    except (ImportError, OSError, AttributeError):
+        return None
+
+
+class StageEvent:
+    # phase: 'start' or 'end'; attrs: what the stage works on (sheet, table,
+    # index, rows, ...). Measurements are only set on 'end' events.
+    def __init__(self, stage, phase, attrs, wall_s=None, cpu_s=None, peak_rss_delta_bytes=None,
+                 peak_rss_bytes=None, error=None):
+        self.stage = stage
+        self.phase = phase
+        self.attrs = attrs
+        self.wall_s = wall_s
+        self.cpu_s = cpu_s
+        self.peak_rss_delta_bytes = peak_rss_delta_bytes
+        self.peak_rss_bytes = peak_rss_bytes
+        self.error = error
+
+    def describe(self):
+        # 'fill_table 溫室氣體排放係數資訊彙整表 (140 rows)'
+        label = self.attrs.get('table') or self.attrs.get('sheet') or ''
+        rows = self.attrs.get('rows')
+        text = f"{self.stage} {label}".strip()
+        return f"{text} ({rows} rows)" if rows is not None else text
+
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'phase': self.phase,
+            **self.attrs,
+            'wall_s': self.wall_s,
+            'cpu_s': self.cpu_s,
+            'peak_rss_delta_bytes': self.peak_rss_delta_bytes,
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        if self.phase == 'start':
+            return f"<StageEvent start {self.describe()}>"
+        return f"<StageEvent end {self.describe()} {self.wall_s:.3f}s>"
+
+
+class BuildInstrumentation:
+    # subscribers: callables taking a StageEvent, called on the building thread
+    # profile_stage: stage name captured with profile ('cprofile' or
+    # 'tracemalloc') into profile_dir, one file per occurrence
+    def __init__(self, subscribers=(), profile_stage=None, profile='cprofile', profile_dir='.'):
+        if profile not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{profile}'. Available: {PROFILE_MODES}")
+        self.subscribers = list(subscribers)
+        self.profile_stage = profile_stage
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self._profiled = 0
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def emit(self, event):
+        for callback in self.subscribers:
+            callback(event)
+
+    def _profile_path(self, stage, suffix):
+        self._profiled += 1
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return os.path.join(self.profile_dir, f"{stage}-{self._profiled}{suffix}")
+
+    @contextmanager
+    def _capture(self, stage, attrs):
+        if stage != self.profile_stage:
+            yield
+            return
+        if self.profile == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                attrs['profile_path'] = self._profile_path(stage, '.prof')
+                profiler.dump_stats(attrs['profile_path'])
+            return
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            attrs['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            attrs['profile_path'] = self._profile_path(stage, '-tracemalloc.txt')
+            with open(attrs['profile_path'], 'w', encoding='utf-8') as f:
+                for statistic in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                    f.write(f"{statistic}\n")
+
+    @contextmanager
+    def stage(self, name, **attrs):
+        # Yields the attrs dict, so a stage can add what it only learns while
+        # running (e.g. rows) before the end event is sent
+        self.emit(StageEvent(name, 'start', dict(attrs)))
+        peak_before = peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        error = None
+        try:
+            with self._capture(name, attrs):
+                yield attrs
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            wall_s = time.perf_counter() - wall_start
+            cpu_s = time.process_time() - cpu_start
+            peak_after = peak_rss()
+            delta = peak_after - peak_before if peak_after is not None and peak_before is not None else None
+            self.emit(StageEvent(name, 'end', attrs, wall_s, cpu_s, delta, peak_after, error))
+
+
+def stage(instrumentation, name, **attrs):
+    # instrumentation.stage(...), or a no-op when instrumentation is None
+    if instrumentation is None:
+        return nullcontext(attrs)
+    return instrumentation.stage(name, **attrs)
+
+
+class StageReport:
+    # Subscriber that keeps every finished stage for a JSON or CSV report
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, event):
+        if event.phase == 'end':
+            self.records.append(event.to_dict())
+
+    def write(self, path):
+        # Format from the extension: .json, anything else is CSV
+        if path.lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.records, f, ensure_ascii=False, indent=2)
+            return path
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            for record in self.records:
+                row = {field: record.get(field) for field in REPORT_FIELDS if field != 'details'}
+                details = {k: v for k, v in record.items() if k not in REPORT_FIELDS and k != 'phase'}
+                row['details'] = json.dumps(details, ensure_ascii=False) if details else ''
+                writer.writerow(row)
+        return path
@@ -0,0 +1,160 @@
+# Values-only, display-formatted copy of a workbook; the headless port of
+# export_value_as_formatted.bas. Every worksheet is streamed row by row from a
+# read-only workbook into a write-only one, so memory stays flat whatever the
+# sheet size and no Excel installation is needed.
+#
+# Usage:
+#   python export_formatted.py inventory.xlsx [inventory_values.xlsx]
+#
+# Same rules as the macro:
+#   - formulas are replaced by their cached values
+#   - numbers keep what their number format displays (rounded to the shown
+#     decimals, percent and thousands scaling included) and keep the format
+#   - General cells get 0.0000000000 below 1e-4, 0.00 otherwise, and text gets @
+#   - column widths are copied
+
+import argparse
+import os
+import re
+import sys
+import zipfile
+from decimal import Decimal
+
+from lxml import etree
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+from number_formats import compile_number_format
+from report_manifest import workbook_sheet_parts
+
+GENERAL_FORMAT = 'General'
+SMALL_NUMBER_FORMAT = '0.0000000000'
+NUMBER_FORMAT = '0.00'
+TEXT_FORMAT = '@'
+SMALL_NUMBER_LIMIT = 1e-4
+
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+# A number as the report builder displays it: 1,234.50, .5, 1.23E+04
+_DISPLAYED_NUMBER = re.compile(r'(?:\d[\d,]*)?\.?\d+(?:E[+-]?\d+)?')
+
+
+def displayed_number(value, number_format):
+    # The number a cell shows under its format, at the magnitude of the value
+    # (the macro re-reads .Text, so 12.345 shown as 12.35 is stored as 12.35).
+    # The text comes from the number_formats engine the report builder uses.
+    if value == 0 or not isinstance(value, (int, float)) or isinstance(value, bool):
+        return value
+    formatter = compile_number_format(number_format)
+    scale = formatter.scale(value)
+    if scale is None:
+        return value  # the format shows no rounded digits of its own
+    # Literal text can carry digits of its own ("Q1 "0.00); the number is the longest run
+    found = _DISPLAYED_NUMBER.findall(formatter(value))
+    if not found:
+        return value
+    shown = float(Decimal(max(found, key=len).replace(',', '')) / scale)
+    result = shown if value > 0 else -shown
+    return int(result) if isinstance(value, int) and result == int(result) else result
+
+
+def export_cell(value, number_format):
+    # (value, number format) written for one source cell
+    number_format = number_format or GENERAL_FORMAT
+    is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if number_format == GENERAL_FORMAT:
+        if is_number:
+            return value, SMALL_NUMBER_FORMAT if abs(value) < SMALL_NUMBER_LIMIT else NUMBER_FORMAT
+        return value, TEXT_FORMAT
+    if is_number:
+        return displayed_number(value, number_format), number_format
+    return value, number_format
+
+
+def read_column_widths(zf, part_name):
+    # <cols> sits before <sheetData>, so only the head of the sheet part is parsed.
+    # Read-only worksheets do not load column dimensions themselves.
+    widths = []
+    with zf.open(part_name) as src:
+        for event, element in etree.iterparse(src, events=('start', 'end')):
+            if element.tag == f'{{{SHEET_NS}}}sheetData':
+                break
+            if event == 'end' and element.tag == f'{{{SHEET_NS}}}col':
+                width = element.get('width')
+                if width is not None:
+                    widths.append((
+                        int(element.get('min')),
+                        int(element.get('max')),
+                        float(width),
+                        element.get('hidden') in ('1', 'true'),
+                    ))
+    return widths
+
+
+def _copy_column_widths(zf, part_name, target):
+    if part_name is None:
+        return
+    for first, last, width, hidden in read_column_widths(zf, part_name):
+        dimension = target.column_dimensions[get_column_letter(first)]
+        dimension.min, dimension.max = first, last
+        dimension.width = width
+        dimension.hidden = hidden
+
+
+def _export_rows(source, target):
+    # Trailing empty rows are never written; empty rows in between are only
+    # counted until the next row with data
+    pending_blank = 0
+    for row in source.iter_rows():
+        cells = []
+        for cell in row:
+            if cell.value is None:
+                cells.append(None)
+                continue
+            value, number_format = export_cell(cell.value, cell.number_format)
+            out = WriteOnlyCell(target, value=value)
+            out.number_format = number_format
+            cells.append(out)
+        if not any(c is not None for c in cells):
+            pending_blank += 1
+            continue
+        for _ in range(pending_blank):
+            target.append([])
+        pending_blank = 0
+        target.append(cells)
+
+
+def export_values_as_formatted(excel_path, output_path=None):
+    if output_path is None:
+        root, ext = os.path.splitext(excel_path)
+        output_path = f"{root}_values{ext or '.xlsx'}"
+    source_book = load_workbook(excel_path, read_only=True, data_only=True)
+    target_book = Workbook(write_only=True)
+    try:
+        with zipfile.ZipFile(excel_path) as zf:
+            sheet_parts = workbook_sheet_parts(zf)
+            for source in source_book.worksheets:
+                source.reset_dimensions()  # trust the cell data, not a stale <dimension>
+                target = target_book.create_sheet(source.title)
+                _copy_column_widths(zf, sheet_parts.get(source.title), target)  # must precede the first row
+                _export_rows(source, target)
+        target_book.save(output_path)
+    finally:
+        source_book.close()
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy every sheet as plain values, keeping the displayed formatting.")
+    parser.add_argument('excel_path', help="Source workbook (.xlsx)")
+    parser.add_argument('output_path', nargs='?', default=None,
+                        help="Destination workbook (default: <source>_values.xlsx)")
+    args = parser.parse_args(argv)
+    output_path = export_values_as_formatted(args.excel_path, args.output_path)
+    print(f"Values copied to {output_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
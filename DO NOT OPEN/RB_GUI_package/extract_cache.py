@@ -0,0 +1,172 @@
+# Persistent cache of extracted sheet data. What the Excel readers return for
+# a sheet depends only on that sheet's XML part, the shared strings and styles
+# parts and the extraction spec, so results are stored under a hash of exactly
+# those. A rebuild, or another template built from the same workbook, then
+# skips openpyxl/pandas parsing for every sheet that did not change.
+#
+# Entries are pickles in CACHE_DIR/sheets; the least recently used ones are
+# evicted once the directory grows past EXTRACT_CACHE_MAX_BYTES.
+#
+#   python extract_cache.py            # hit/miss statistics and size
+#   python extract_cache.py --clear
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+
+from report_template import CACHE_DIR
+
+# Bump whenever extraction or value rendering changes what a reader returns
+EXTRACT_CACHE_VERSION = 4
+EXTRACT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+STATS_FILE_NAME = 'stats.json'
+
+
+def extract_key(sheet_digest, shared_digest, kind, spec):
+    # None when spec cannot be keyed (e.g. a callable post hook)
+    try:
+        encoded_spec = json.dumps(spec, ensure_ascii=False, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    material = f"{EXTRACT_CACHE_VERSION}\n{sheet_digest}\n{shared_digest}\n{kind}\n{encoded_spec}"
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ExtractCache:
+    def __init__(self, cache_dir=os.path.join(CACHE_DIR, 'sheets'), max_bytes=EXTRACT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def get(self, key):
+        # -> (found, value)
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # recency for eviction
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return False, None
+        with self._lock:
+            self.hits += 1
+        return True, value
+
+    def put(self, key, value):
+        path = self._path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            return  # the cache is an optimization only
+        self._evict()
+
+    def _entries(self):
+        try:
+            with os.scandir(self.cache_dir) as it:
+                return [
+                    (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                    for entry in it if entry.name.endswith('.pkl')
+                ]
+        except OSError:
+            return []
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):  # oldest first
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def record_stats(self):
+        # Adds this process's counts to the running totals kept next to the
+        # entries (best effort: concurrent builds may drop a few counts)
+        path = os.path.join(self.cache_dir, STATS_FILE_NAME)
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+        if not hits and not misses:
+            return
+        totals = self.load_stats()
+        totals['hits'] += hits
+        totals['misses'] += misses
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(totals, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def load_stats(self):
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILE_NAME), 'r', encoding='utf-8') as f:
+                totals = json.load(f)
+            return {'hits': int(totals.get('hits', 0)), 'misses': int(totals.get('misses', 0))}
+        except (OSError, ValueError, AttributeError):
+            return {'hits': 0, 'misses': 0}
+
+    def stats(self):
+        entries = self._entries()
+        totals = self.load_stats()
+        return {
+            'hits': totals['hits'] + self.hits,
+            'misses': totals['misses'] + self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            os.remove(os.path.join(self.cache_dir, STATS_FILE_NAME))
+        except OSError:
+            pass
+
+
+EXTRACT_CACHE = ExtractCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or clear the extracted sheet data cache.")
+    parser.add_argument('--clear', action='store_true', help="Remove every cached entry")
+    args = parser.parse_args(argv)
+    if args.clear:
+        EXTRACT_CACHE.clear()
+        print(f"Cleared {EXTRACT_CACHE.cache_dir}")
+        return 0
+    stats = EXTRACT_CACHE.stats()
+    lookups = stats['hits'] + stats['misses']
+    rate = f"{stats['hits'] / lookups:.0%}" if lookups else 'n/a'
+    print(f"{EXTRACT_CACHE.cache_dir}: {stats['entries']} entries, "
+          f"{stats['bytes'] / 1024 / 1024:.1f} of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"hits {stats['hits']}, misses {stats['misses']} (hit rate {rate})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,345 @@
+# Excel number-format rendering for report text. Each distinct number_format
+# string is compiled once into a formatter callable (kept in an LRU cache), so
+# rendering a cell is a dict lookup plus the arithmetic for its own value.
+#
+# Covered: General, digit placeholders (0 # ?), decimals, thousands separators
+# and scaling commas, percent, scientific notation, literals ("text", \x, _x,
+# *x, [$sym-locale]), positive;negative;zero;text sections and @.
+# Colours and [conditions] are ignored. Date/time formats are not rendered:
+# dates keep str(value) and serial numbers fall back to General. Fraction
+# sections (a / outside a date) are not supported and render as General.
+
+import re
+from datetime import date, datetime, time
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+GENERAL = 'General'
+NUMBER_FORMAT_CACHE_SIZE = 256
+
+# Excel's General shows at most 11 characters: 10 significant digits in fixed
+# notation between 1e-4 and 1e11, scientific with 5 mantissa decimals outside
+GENERAL_DIGITS = 10
+GENERAL_FIXED_MIN = Decimal('1e-4')
+GENERAL_FIXED_MAX = Decimal('1e11')
+
+_TOKEN = re.compile(
+    r'"(?P<quoted>[^"]*)"?'
+    r'|\\(?P<escaped>.)'
+    r'|_(?P<pad>.)'
+    r'|\*(?P<fill>.)'
+    r'|\[(?P<bracket>[^\]]*)\]'
+    r'|(?P<general>(?i:general))'
+    r'|(?P<exponent>[eE][+-])'
+    r'|(?P<digit>[0#?])'
+    r'|(?P<char>.)',
+    re.S,
+)
+_DATE_CHARS = set('dmyhsDMYHS')
+
+
+def _split_sections(number_format):
+    # Semicolons inside quotes or brackets do not separate sections
+    sections, start = [], 0
+    for match in re.finditer(r'"[^"]*"?|\\.|\[[^\]]*\]|;', number_format):
+        if match.group() == ';':
+            sections.append(number_format[start:match.start()])
+            start = match.end()
+    sections.append(number_format[start:])
+    return sections
+
+
+def _to_decimal(value):
+    # repr keeps the shortest round-trip digits, which is what Excel rounds from
+    return Decimal(repr(value)) if isinstance(value, float) else Decimal(value)
+
+
+def _trim_zeros(digits):
+    return digits.rstrip('0').rstrip('.') if '.' in digits else digits
+
+
+def render_general(value):
+    number = abs(_to_decimal(value))
+    sign = '-' if value < 0 else ''
+    if number == 0:
+        return '0'
+    if GENERAL_FIXED_MIN <= number < GENERAL_FIXED_MAX:
+        decimals = max(0, GENERAL_DIGITS - 1 - number.adjusted()) if number.adjusted() >= 0 else GENERAL_DIGITS - 1
+        return sign + _trim_zeros(f"{number.quantize(Decimal(1).scaleb(-decimals), ROUND_HALF_UP):f}")
+    exponent = number.adjusted()
+    mantissa = number.scaleb(-exponent).quantize(Decimal('1e-5'), ROUND_HALF_UP)
+    if mantissa >= 10:
+        exponent += 1
+        mantissa = number.scaleb(-exponent).quantize(Decimal('1e-5'), ROUND_HALF_UP)
+    return f"{sign}{_trim_zeros(f'{mantissa:f}')}E{'-' if exponent < 0 else '+'}{abs(exponent):02d}"
+
+
+def _group_thousands(text):
+    head = text.lstrip(' ')
+    digits = head.lstrip('0') or ('0' if head else '')
+    lead = head[:len(head) - len(digits)]
+    groups = []
+    while len(digits) > 3:
+        groups.insert(0, digits[-3:])
+        digits = digits[:-3]
+    groups.insert(0, digits)
+    return text[:len(text) - len(head)] + lead + ','.join(g for g in groups if g)
+
+
+class _Section:
+    # One ;-separated part of a number format, parsed into an item list of
+    # literal strings and placeholder markers that render() fills in
+    def __init__(self, source):
+        self.items = []  # str literal or (part, placeholder) with part in int/dec/exp
+        self.has_text = False
+        self.has_general = False
+        self.is_date = False
+        self.thousands = False
+        self.percent = 0
+        self.scale_commas = 0
+        self.exponent_sign = None  # 'E+' / 'E-' when scientific
+        self.unsupported = False  # a fraction section
+        part = 'int'
+        pending_commas = 0
+        fraction = False  # a / outside a date format
+        for match in _TOKEN.finditer(source):
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == 'digit':
+                if pending_commas and part == 'int' and self._has_placeholder('int'):
+                    self.thousands = True
+                pending_commas = 0
+                self.items.append((part, text))
+                continue
+            if kind == 'char' and text == ',':
+                pending_commas += 1
+                continue
+            # Commas right after the digits (not followed by one) scale by 1000 each
+            self.scale_commas += pending_commas if self._has_placeholder('int') or self._has_placeholder('dec') else 0
+            pending_commas = 0
+            if kind == 'char' and text == '.' and part == 'int':
+                part = 'dec'
+                self.items.append(('point', '.'))
+            elif kind == 'exponent':
+                part = 'exp'
+                self.exponent_sign = text.upper()
+                self.items.append(('exp_sign', ''))
+            elif kind == 'general':
+                self.has_general = True
+                self.items.append(('general', ''))
+            elif kind == 'char' and text == '@':
+                self.has_text = True
+                self.items.append(('text', ''))
+            elif kind == 'char' and text in _DATE_CHARS:
+                self.is_date = True
+            elif kind == 'char' and text == '/':
+                fraction = True
+            elif kind == 'char':
+                if text == '%':
+                    self.percent += 1
+                self.items.append(text)
+            elif kind in ('quoted', 'escaped'):
+                self.items.append(text)
+            elif kind == 'pad':
+                self.items.append(' ')
+            elif kind == 'bracket' and text.startswith('$'):
+                self.items.append(text[1:].split('-', 1)[0])
+        self.unsupported = fraction and not self.is_date
+        self.scale_commas += pending_commas if self._has_placeholder('int') or self._has_placeholder('dec') else 0
+        self.placeholders = {
+            name: [i for i, item in enumerate(self.items) if isinstance(item, tuple) and item[0] == name]
+            for name in ('int', 'dec', 'exp')
+        }
+        self.is_number = any(self.placeholders.values())
+        self.scale = Decimal(100) ** self.percent / Decimal(1000) ** self.scale_commas
+        self.fixed = self._compile_fixed()
+
+    def _compile_fixed(self):
+        # Plain sections such as 0.00 or "+"#,##0.0000_) render through one
+        # Decimal format call: (prefix, quantum, format spec, suffix)
+        int_slots, dec_slots = self.placeholders['int'], self.placeholders['dec']
+        if self.placeholders['exp'] or self.has_general or self.has_text or not int_slots:
+            return None
+        if not re.fullmatch(r'#*0', ''.join(self.items[i][1] for i in int_slots)):
+            return None
+        if any(self.items[i][1] != '0' for i in dec_slots):
+            return None
+        last = (dec_slots or int_slots)[-1]
+        body = self.items[int_slots[0]:last + 1]
+        if any(not isinstance(item, tuple) for item in body):
+            return None
+        # A point with no decimals still shows ("0." renders 5 as "5.")
+        tail = ['.' if item == ('point', '.') else item for item in self.items[last + 1:]]
+        if any(isinstance(item, tuple) for item in tail):
+            return None
+        prefix = ''.join(self.items[:int_slots[0]])
+        return prefix, Decimal(1).scaleb(-len(dec_slots)), ',f' if self.thousands else 'f', ''.join(tail)
+
+    def _has_placeholder(self, part):
+        return any(isinstance(item, tuple) and item[0] == part for item in self.items)
+
+    def render_text(self, text):
+        out = []
+        for item in self.items:
+            if isinstance(item, str):
+                out.append(item)
+            elif item[0] == 'text':
+                out.append(text)
+        return ''.join(out)
+
+    def render(self, value):
+        # value is the magnitude; NumberFormat decides the section and the sign
+        if self.is_date or not (self.is_number or self.has_general):
+            if self.is_date:
+                return render_general(value)
+            return ''.join(item for item in self.items if isinstance(item, str))
+        out = list(self.items)
+        if self.has_general:
+            for i, item in enumerate(out):
+                if isinstance(item, tuple):
+                    out[i] = render_general(value) if item[0] == 'general' else ''
+            return ''.join(out)
+
+        number = abs(_to_decimal(value))
+        if self.scale != 1:
+            number *= self.scale
+        if self.fixed is not None:
+            prefix, quantum, spec, suffix = self.fixed
+            return prefix + format(number.quantize(quantum, ROUND_HALF_UP), spec) + suffix
+        int_slots, dec_slots, exp_slots = self.placeholders['int'], self.placeholders['dec'], self.placeholders['exp']
+        quantum = Decimal(1).scaleb(-len(dec_slots))
+        exponent = 0
+        if self.exponent_sign is not None and number != 0:
+            group = max(1, len(int_slots))
+            exponent = number.adjusted() - number.adjusted() % group
+            mantissa = number.scaleb(-exponent).quantize(quantum, ROUND_HALF_UP)
+            if mantissa >= Decimal(10) ** group:
+                exponent += group
+                mantissa = number.scaleb(-exponent).quantize(quantum, ROUND_HALF_UP)
+            number = mantissa
+        else:
+            number = number.quantize(quantum, ROUND_HALF_UP)
+        int_digits, _, dec_digits = f"{number:f}".partition('.')
+        int_digits = int_digits.lstrip('0')
+
+        # Integer digits fill the placeholders right to left; the leftmost one
+        # takes whatever digits remain
+        remaining = int_digits
+        for n, slot in enumerate(reversed(int_slots)):
+            placeholder = out[slot][1]
+            if n == len(int_slots) - 1:
+                take, remaining = remaining, ''
+            else:
+                take, remaining = remaining[-1:], remaining[:-1]
+            out[slot] = take or {'0': '0', '?': ' ', '#': ''}[placeholder]
+        if self.thousands and int_slots:
+            grouped = _group_thousands(''.join(out[slot] for slot in int_slots))
+            for slot in int_slots:
+                out[slot] = ''
+            out[int_slots[0]] = grouped
+
+        significant = dec_digits.rstrip('0')
+        for n, slot in enumerate(dec_slots):
+            placeholder = out[slot][1]
+            if n < len(significant):
+                out[slot] = significant[n]
+            else:
+                out[slot] = {'0': '0', '?': ' ', '#': ''}[placeholder]
+
+        if exp_slots:
+            # Exponent digits are zero-padded to the placeholders; extra digits go first
+            exp_digits = str(abs(exponent)).zfill(len(exp_slots))
+            extra = len(exp_digits) - len(exp_slots)
+            for n, slot in enumerate(exp_slots):
+                out[slot] = exp_digits[:extra + 1] if n == 0 else exp_digits[extra + n]
+        sign = '-' if exponent < 0 else ('+' if self.exponent_sign == 'E+' else '')
+        for i, item in enumerate(out):
+            if isinstance(item, tuple):
+                out[i] = {'point': '.', 'exp_sign': 'E' + sign}.get(item[0], '')
+        return ''.join(out)
+
+
+class NumberFormat:
+    # Compiled formatter for one number_format string; call it with a cell value
+    def __init__(self, number_format):
+        self.number_format = number_format
+        sources = _split_sections(number_format)
+        self.is_general = len(sources) == 1 and sources[0].strip().lower() in ('', 'general')
+        self.sections = [_Section(source) for source in sources]
+        text_sections = [s for s in self.sections if s.has_text]
+        if len(self.sections) >= 4:
+            self.text_section = self.sections[3]
+        elif len(self.sections) == 1 and text_sections:
+            self.text_section = text_sections[0]
+        else:
+            self.text_section = None
+
+    def __call__(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'TRUE' if value else 'FALSE'
+        if isinstance(value, str):
+            return self.text_section.render_text(value) if self.text_section is not None else value
+        if isinstance(value, (datetime, date, time)) or not isinstance(value, (int, float)):
+            return str(value)
+        if value != value or value in (float('inf'), float('-inf')):
+            return str(value)
+        if self.is_general:
+            return render_general(value)
+        return self._render_number(value)
+
+    def _section(self, value):
+        # (section that formats a number, whether it gets a sign): a negative
+        # section shows the magnitude; the first section gets a sign
+        if value < 0 and len(self.sections) >= 2:
+            return self.sections[1], False
+        if value == 0 and len(self.sections) >= 3:
+            return self.sections[2], False
+        return self.sections[0], True
+
+    def scale(self, value):
+        # Percent and comma scaling of the digits shown for value; None when its
+        # section shows no digits of its own (General, dates, text, fractions)
+        if self.is_general:
+            return None
+        section, _ = self._section(value)
+        if section.unsupported or section.is_date or section.has_general or not section.is_number:
+            return None
+        return section.scale
+
+    def _render_number(self, value):
+        section, signed = self._section(value)
+        if section.unsupported:
+            return render_general(value)  # fraction sections are not rendered
+        if not signed:
+            return section.render(abs(value))
+        if section.has_text and not (section.is_number or section.has_general):
+            return render_general(value)  # '@' shows numbers as General
+        text = section.render(abs(value))
+        return '-' + text if value < 0 else text
+
+
+@lru_cache(maxsize=NUMBER_FORMAT_CACHE_SIZE)
+def compile_number_format(number_format):
+    return NumberFormat(number_format or GENERAL)
+
+
+def render_value(value, number_format=GENERAL):
+    return compile_number_format(number_format or GENERAL)(value)
+
+
+def render_column(values, number_formats=GENERAL):
+    # Column-wise rendering: number_formats is one format for the whole column
+    # or one per value; each distinct format is looked up once per call
+    if isinstance(number_formats, str) or number_formats is None:
+        formatter = compile_number_format(number_formats or GENERAL)
+        return [formatter(value) for value in values]
+    formatters = {}
+    rendered = []
+    for value, number_format in zip(values, number_formats):
+        formatter = formatters.get(number_format)
+        if formatter is None:
+            formatter = formatters[number_format] = compile_number_format(number_format or GENERAL)
+        rendered.append(formatter(value))
+    return rendered
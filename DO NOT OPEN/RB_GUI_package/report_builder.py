@@ -4,16 +4,44 @@
 # pip install openpyxl python-docx pandas
 
 # Import necessary libraries
+import io
+import mmap
+import multiprocessing
 import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
 from docx import Document
+from lxml import etree
 from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple
 from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.simpletypes import ST_Merge
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 from docx.shared import Pt
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
-import pandas as pd
+# numpy/pandas are imported where 表5 is parsed (reshape_emission_factors,
+# WorkbookSnapshot.dataframe): they dominate import time, and a build whose 表5
+# comes from the extract cache never needs them
 import json
+from build_instrumentation import stage
+from extract_cache import EXTRACT_CACHE, extract_key
+from number_formats import render_column, render_value
+from report_manifest import (BuildManifest, discard_manifest, load_manifest, plan_signature, plan_dependencies,
+                             save_manifest, shared_parts_hash, sheet_part_hash, workbook_sheet_parts)
+from report_plan import DEFAULT_MAPPING_PATH, PLAN_CACHE, extract_spec, load_mapping
+from report_template import (TEMPLATE_CACHE, TableRegistry, compile_template, file_sha256, iter_story_parts,
+                             resolve_path, scan_tables)
+from xlsx_stream import StreamingWorkbook
 
 # ===== Config knobs (keeps original behavior but safer defaults) =====
 EAST_ASIA_FONT = '標楷體'  # Better for Chinese
@@ -21,6 +49,39 @@ DEFAULT_RUN_FONT = 'Times New Roman'
 DEFAULT_RUN_SIZE_PT = 12
 COLUMN_WIDTH_DXA_DEFAULT = 2000
 
+# Report layout (sheets -> tables, placeholders -> cells); see report_plan
+DEFAULT_MAPPING = load_mapping(DEFAULT_MAPPING_PATH)
+
+# Vertical merges emitted while a table is filled: table ID -> data key whose
+# runs of equal values form the groups, and the table columns merged per group
+TABLE_GROUP_MERGES = {
+    table['table']: table['group_merge'] for table in DEFAULT_MAPPING['tables'] if table.get('group_merge')
+}
+EMISSION_FACTOR_TABLE = '溫室氣體排放係數資訊彙整表'
+
+# How sheets are parsed: 'openpyxl' (read-only workbook, every sheet materialized
+# once) or 'lxml' (xlsx_stream: streamed per read, projected columns only).
+# Both return the same values, so extract cache entries are shared.
+EXCEL_BACKENDS = ('openpyxl', 'lxml')
+EXCEL_BACKEND = os.environ.get('GHG_REPORT_BUILDER_EXCEL_BACKEND') or 'openpyxl'
+
+# Where a build extracts its sheets while the template loads: 'thread' workers
+# share the snapshot's memory map (the GIL limits how much openpyxl parsing
+# overlaps; zip inflation and lxml parsing release it), 'process' workers map
+# the same file themselves (its pages are shared through the OS cache) and parse
+# truly in parallel, at the cost of starting one interpreter per worker
+SHEET_POOLS = ('thread', 'process')
+SHEET_POOL = os.environ.get('GHG_REPORT_BUILDER_SHEET_POOL') or 'thread'
+SHEET_WORKERS = int(os.environ.get('GHG_REPORT_BUILDER_SHEET_WORKERS') or 0) or min(8, os.cpu_count() or 1)
+
+# How tables are filled: 'serial' (in the building process) or 'process': tables
+# of at least TABLE_RENDER_MIN_ROWS rows are rendered as w:tbl fragments by
+# SHEET_WORKERS worker processes and spliced back into the document, so a large
+# inventory takes about as long as its largest table instead of all of them
+TABLE_RENDER_MODES = ('serial', 'process')
+TABLE_RENDER = os.environ.get('GHG_REPORT_BUILDER_TABLE_RENDER') or 'serial'
+TABLE_RENDER_MIN_ROWS = 200
+
 # ===== Helpers kept internal (no interface/name changes to public functions) =====
 def _set_run_style(run):
     run.font.size = Pt(DEFAULT_RUN_SIZE_PT)
@@ -45,242 +106,452 @@ def format_value(cell):
     if value is None:
         return ''
     number_format = getattr(cell, 'number_format', '') or ''
-    # Handle percent formats robustly
-    if isinstance(value, (int, float)) and ('%' in number_format or '0%' in number_format):
-        val = value if 0 <= value <= 1 else value / 100.0
-        return f"{val * 100:.2f}%"  # Format as percentage with two decimal places
-
-    # Force 0 → 0.0000
-    if isinstance(value, (int, float)) and value == 0:
-        return "0.0000"
-
-    # You might also want to format all numbers consistently:
-    # if isinstance(value, (int, float)):
-    #     return f"{value:.4f}"
+    # Placeholders read as Excel displays the cell under its number format, the
+    # same text a table column gets (less the alignment padding #,##0_) adds)
+    text = render_value(value, number_format).strip()
+    # Except whole numbers typed into fixed-decimal cells: years, months and
+    # version numbers read as 2024, not 2024.00, in the text
+    if isinstance(value, int) and not isinstance(value, bool) and value and re.fullmatch(rf'{value}\.0+', text):
+        return str(value)
+    return text
+
+
+# ===== Excel layer: parse the workbook once, serve every reader from memory =====
+class SheetSnapshot:
+    # Rows of read-only cells (value + number_format) for one sheet, materialized
+    # in a single forward pass; cell lookups are O(1) afterwards.
+    def __init__(self, title, rows):
+        self.title = title
+        self.rows = rows
+
+    @property
+    def max_row(self):
+        return len(self.rows)
+
+    def cell(self, row, column):
+        if 1 <= row <= len(self.rows):
+            cells = self.rows[row - 1]
+            if 1 <= column <= len(cells):
+                return cells[column - 1]
+        return EMPTY_CELL
+
+    def __getitem__(self, coordinate):
+        row, column = coordinate_to_tuple(coordinate)
+        return self.cell(row, column)
+
+    def cells(self, coordinates):
+        return {coordinate: self[coordinate] for coordinate in coordinates}
+
+    def iter_rows(self, min_row=1, max_row=None, columns=None, values_only=False):
+        # columns: optional 1-based column indices to project each row onto
+        stop = len(self.rows) if max_row is None else min(max_row, len(self.rows))
+        for idx in range(min_row - 1, stop):
+            row = self.rows[idx]
+            if columns is not None:
+                width = len(row)
+                row = tuple(row[c - 1] if c <= width else EMPTY_CELL for c in columns)
+            if values_only:
+                row = tuple(cell.value for cell in row)
+            yield row
+
+
+def _pandas_cell_value(cell):
+    # Same conversion pandas' openpyxl reader applies before parsing
+    if cell.value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return float('nan')
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+class MappedView(io.RawIOBase):
+    # Read-only file object over a shared memory map with its own position, so
+    # every ZipFile opened on the workbook reads the one mapping without copying it
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def read(self, size=-1):
+        end = len(self._data) if size is None or size < 0 else self._pos + size
+        chunk = self._data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def _map_file(path):
+    # Read-only memory map of the file (bytes for an empty one, which cannot be mapped)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class WorkbookSnapshot:
+    # Memory-maps the .xlsx once and keeps one read-only, data-only workbook
+    # open over it. Sheets are parsed lazily on first use and then shared by
+    # read_excel_data, read_excel_data_pandas and read_excel_cells; readers may
+    # run on several threads at once (see SheetExtraction).
+    # cache: an ExtractCache for reader results (None disables it); the
+    # workbook itself is only loaded once some reader misses the cache.
+    # backend: one of EXCEL_BACKENDS; with 'lxml' sheets are streamed from the
+    # zip by xlsx_stream instead and openpyxl never loads the workbook.
+    def __init__(self, excel_path, cache=EXTRACT_CACHE, backend=None):
+        backend = backend or EXCEL_BACKEND
+        if backend not in EXCEL_BACKENDS:
+            raise ValueError(f"Unknown Excel backend '{backend}'. Available: {EXCEL_BACKENDS}")
+        self.excel_path = excel_path
+        self.cache = cache
+        self.backend = backend
+        self._data = _map_file(excel_path)
+        self._zip = zipfile.ZipFile(MappedView(self._data))
+        self._sheet_parts = workbook_sheet_parts(self._zip)
+        self.sheetnames = list(self._sheet_parts)
+        self._shared_digest = None
+        self._sheet_digests = {}
+        self._workbook = None
+        self._stream = None
+        self._closed = False
+        self._sheets = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+        self._sheet_locks = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def workbook(self):
+        with self._lock:
+            if self._workbook is None:
+                if self._closed:
+                    raise ValueError(f"Workbook snapshot of {self.excel_path} is closed")
+                self._workbook = load_workbook(MappedView(self._data), read_only=True, data_only=True)
+            return self._workbook
+
+    @property
+    def stream(self):
+        with self._lock:
+            if self._stream is None:
+                if self._closed:
+                    raise ValueError(f"Workbook snapshot of {self.excel_path} is closed")
+                self._stream = StreamingWorkbook(self._zip, self._sheet_parts)
+            return self._stream
+
+    def _sheet_digest(self, sheet_name):
+        digest = self._sheet_digests.get(sheet_name)
+        if digest is None:
+            digest = self._sheet_digests[sheet_name] = sheet_part_hash(self._zip, self._sheet_parts, sheet_name)
+        return digest
+
+    def _shared_parts_digest(self):
+        if self._shared_digest is None:
+            self._shared_digest = shared_parts_hash(self._zip)
+        return self._shared_digest
+
+    def source_hashes(self, sheet_names):
+        # Same as report_manifest.source_hashes, from the mapped snapshot; the
+        # digests are reused as extract cache keys
+        return {
+            'sheets': {name: self._sheet_digest(name) for name in sheet_names},
+            'shared': self._shared_parts_digest(),
+        }
 
-    return str(value)
+    def count_cache(self, hits, misses):
+        with self._lock:
+            self.cache_hits += hits
+            self.cache_misses += misses
+
+    def cached(self, sheet_name, kind, spec, compute):
+        # compute() derives a result from this sheet alone (plus shared strings
+        # and styles); it is stored under the hash of exactly those parts
+        if self.cache is None or sheet_name not in self._sheet_parts:
+            return compute()
+        key = extract_key(self._sheet_digest(sheet_name), self._shared_parts_digest(), kind, spec)
+        if key is None:
+            return compute()
+        found, value = self.cache.get(key)
+        if found:
+            self.count_cache(1, 0)
+            return value
+        self.count_cache(0, 1)
+        value = compute()
+        self.cache.put(key, value)
+        return value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self._zip.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self.sheetnames
+
+    def __getitem__(self, sheet_name):
+        sheet = self._sheets.get(sheet_name)
+        if sheet is not None:
+            return sheet
+        if sheet_name not in self.sheetnames:
+            raise ValueError(f"Sheet '{sheet_name}' not found. Available: {self.sheetnames}")
+        with self._lock:
+            sheet_lock = self._sheet_locks.setdefault(sheet_name, threading.Lock())
+        with sheet_lock:  # concurrent readers of one sheet parse it once
+            sheet = self._sheets.get(sheet_name)
+            if sheet is None:
+                if self.backend == 'lxml':
+                    sheet = self.stream[sheet_name]
+                else:
+                    worksheet = self.workbook[sheet_name]
+                    worksheet.reset_dimensions()  # trust the cell data, not a stale <dimension>
+                    sheet = SheetSnapshot(sheet_name, [tuple(row) for row in worksheet.iter_rows()])
+                self._sheets[sheet_name] = sheet
+        return sheet
+
+    def cell(self, sheet_name, coordinate):
+        return self[sheet_name][coordinate]
+
+    def dataframe(self, sheet_name, header=0):
+        # Equivalent of pd.read_excel(excel_path, sheet_name=..., header=...)
+        key = (sheet_name, header)
+        if key not in self._frames:
+            import pandas as pd
+            from pandas.io.parsers import TextParser
+            data = []
+            last_row_with_data = -1
+            for row_number, row in enumerate(self[sheet_name].iter_rows()):
+                converted = [_pandas_cell_value(cell) for cell in row]
+                while converted and converted[-1] == '':
+                    converted.pop()
+                if converted:
+                    last_row_with_data = row_number
+                data.append(converted)
+            data = data[:last_row_with_data + 1]
+            if not data:
+                self._frames[key] = pd.DataFrame()
+            else:
+                width = max(len(row) for row in data)
+                data = [row + [''] * (width - len(row)) for row in data]
+                self._frames[key] = TextParser(data, header=header, skip_blank_lines=False).read()
+        return self._frames[key].copy()
+
+
+@contextmanager
+def _open_snapshot(excel_path):
+    # Readers accept either a path or a WorkbookSnapshot shared by the caller
+    if isinstance(excel_path, WorkbookSnapshot):
+        yield excel_path
+        return
+    snapshot = WorkbookSnapshot(excel_path)
+    try:
+        yield snapshot
+    finally:
+        snapshot.close()
 
 
 def read_excel_data(excel_path, sheet_name, start_cells=1):
-    workbook = load_workbook(excel_path, read_only=True, data_only=True) #Open the workbook in data-only mode which means it will not evaluate formulas, just return the values.
-
-    if sheet_name not in workbook.sheetnames:
-        workbook.close()
-        raise ValueError(f"Sheet '{sheet_name}' not found. Available: {workbook.sheetnames}")
-
-    sheet = workbook[sheet_name]
-
-    if sheet_name == '表1.基本資料':
-        data = {
-            'A': [],
-            'C': [],
-        } #Initialize a dictionary for company name (A column) and address (C column)
-        row = 18
-        empty_streak = 0
-        while True:
-            cell_a = f'A{row}'
-            cell_c = f'C{row}'
-            value_a = sheet[cell_a].value
-            value_c = sheet[cell_c].value
-            # Stop only when BOTH are empty for a bit (avoids holes)
-            if (value_a is None or str(value_a).strip() == '') and (value_c is None or str(value_c).strip() == ''):
-                empty_streak += 1
-                if empty_streak >= 2:
-                    break
-            else:
-                empty_streak = 0
-                data['A'].append(value_a)
-                data['C'].append(value_c)
-            row += 1 #Read the columns A and C starting from row 13 until an empty cell is found.
-
-    elif sheet_name == '表2.排放源鑑別':
-        data = {
-            'B': [],
-            'C': [],
-            'E': [],
-            'K': [],
-            'I':[],
-            'C_category3': [],
-            'C_category5': [],
-            'C_category6': [],
-            'C_category7': [],
-            'C_category8': [],
-            'C_category10': [],
-            'C_category11': [],
-            'C_category13': [],
-            'C_category14': [],
-            'C_category15': [],
-            'K_category1':[],
-            'C_category1':[],
-            'others': []
-        }
-        row = 4
-        empty_streak = 0
-        while True:
-            cell_b = f'B{row}'
-            cell_c = f'C{row}'
-            cell_e = f'E{row}'
-            cell_k = f'K{row}'
-            cell_i = f'I{row}'
-            value_b = sheet[cell_b].value
-            value_c = sheet[cell_c].value
-            value_e = sheet[cell_e].value
-            value_k = sheet[cell_k].value
-            value_i = sheet[cell_i].value #There's nothing in I column?????
-
-            # End when core fields are all empty for a couple of rows
-            if all((v is None or str(v).strip() == '') for v in (value_b, value_c, value_e, value_k)):
-                empty_streak += 1
-                if empty_streak >= 2:
-                    break
-                row += 1
-                continue
-            empty_streak = 0
-
-            data['B'].append(value_b)
-            data['C'].append(value_c)
-            data['E'].append(value_e)
-            data['K'].append(value_k)
-            data['I'].append(value_i)
-            data['others'].append('請輸入文字')
-
-            if value_e == '範疇1':
-                data['K_category1'].append(value_k)
-                data['C_category1'].append(value_c)
-            elif value_e == '類別3':
-                data['C_category3'].append(value_c)
-            elif value_e == '類別5':
-                data['C_category5'].append(value_c)
-            elif value_e == '類別6':
-                data['C_category6'].append(value_c)
-            elif value_e == '類別7':
-                data['C_category7'].append(value_c)
-            elif value_e == '類別8':
-                data['C_category8'].append(value_c)
-            elif value_e == '類別10':
-                data['C_category10'].append(value_c)
-            elif value_e == '類別11':
-                data['C_category11'].append(value_c)
-            elif value_e == '類別13':
-                data['C_category13'].append(value_c)
-            elif value_e == '類別14':
-                data['C_category14'].append(value_c)
-            elif value_e == '類別15':
-                data['C_category15'].append(value_c)
-            row += 1
-
-    elif sheet_name == '表3.活動數據':
-        data = {
-            'C': [],
-            'I':[],
-            'others': []
-            }
-        row = 4
-        empty_streak = 0
-        while True:
-            cell_c = f'C{row}'
-            cell_i = f'I{row}'
-            value_c = sheet[cell_c].value
-            value_i = sheet[cell_i].value
-
-            if (value_c is None or str(value_c).strip() == '') and (value_i is None or str(value_i).strip() == ''):
-                empty_streak += 1
-                if empty_streak >= 2:
-                    break
-            else:
-                empty_streak = 0
-                data['C'].append(value_c)
-                data['I'].append(value_i)
-                data['others'].append('請輸入文字')
-            row += 1
-
-    elif sheet_name == '表8.不確定分析':
-        data = {
-            'B': [],
-            'C': [],
-            'D': [],
-            'E': [],
-            'F': [],
-            'G': [],
-            'H': [],
-            'I': [],
-            'J': [],
-            'K': [],
-            'L': [],
-            'M': [],
-        }
-        row = 4
+    with _open_snapshot(excel_path) as workbook: #Data-only snapshot: formulas are not evaluated, cached values are returned.
+        spec = SHEET_EXTRACT_SPECS.get(sheet_name)
+        if spec is None:
+            return {}
+        return workbook.cached(sheet_name, 'rows', spec, lambda: extract_sheet(workbook[sheet_name], spec))
+
+
+def _is_blank(value):
+    return value is None or str(value).strip() == ''
+
+
+# 表2 rows are also grouped by their 範疇/類別 (column E) for the per-category tables
+EMISSION_CATEGORY_COLUMNS = {
+    '類別3': [('C_category3', 'C')],
+    '類別5': [('C_category5', 'C')],
+    '類別6': [('C_category6', 'C')],
+    '類別7': [('C_category7', 'C')],
+    '類別8': [('C_category8', 'C')],
+    '類別10': [('C_category10', 'C')],
+    '類別11': [('C_category11', 'C')],
+    '類別13': [('C_category13', 'C')],
+    '類別14': [('C_category14', 'C')],
+    '類別15': [('C_category15', 'C')],
+    '範疇1': [('K_category1', 'K'), ('C_category1', 'C')],
+}
+
+
+def _split_emission_categories(data):
+    for targets in EMISSION_CATEGORY_COLUMNS.values():
+        for key, _ in targets:
+            data[key] = []
+    for idx, category in enumerate(data['E']):
+        for key, col in EMISSION_CATEGORY_COLUMNS.get(category, ()):
+            data[key].append(data[col][idx])
+
+
+# Named post hooks a sheet's extraction spec can refer to
+SHEET_POST_HOOKS = {
+    'split_emission_categories': _split_emission_categories,
+}
+
+# Per-sheet extraction specs for read_excel_data, from the layout mapping
+# (report_mapping.json):
+#   start_row    - first data row
+#   columns      - projected columns, returned as lists under their letters
+#   stop_columns - a row is empty when all of these are blank
+#   empty_streak - consecutive empty rows that end the sheet (empty rows are skipped)
+#   constants    - extra keys filled with one value per extracted row
+#   post         - optional hook (name in SHEET_POST_HOOKS) that derives more keys
+SHEET_EXTRACT_SPECS = {
+    sheet_name: extract_spec(spec)
+    for sheet_name, spec in DEFAULT_MAPPING['sheets'].items()
+    if spec.get('reader', 'rows') == 'rows'
+}
+
+
+def extract_sheet(sheet, spec):
+    # Single forward pass over the projected columns; cost is linear in row count
+    columns = spec['columns']
+    stop_columns = spec['stop_columns']
+    projected = list(dict.fromkeys(columns + stop_columns))
+    positions = {col: idx for idx, col in enumerate(projected)}
+    stop_positions = [positions[col] for col in stop_columns]
+    indices = [column_index_from_string(col) for col in projected]
+
+    values = {col: [] for col in columns}
+    formats = {col: [] for col in columns}
+    empty_streak = 0
+    for cells in sheet.iter_rows(min_row=spec['start_row'], columns=indices):
+        if all(_is_blank(cells[pos].value) for pos in stop_positions):
+            empty_streak += 1
+            if empty_streak >= spec['empty_streak']:
+                break
+            continue
         empty_streak = 0
-        while True:
-            cells = {col: sheet[f'{col}{row}'].value for col in list('BCDEFGHIJKLM')}
-            if all((v is None or str(v).strip() == '') for v in cells.values()):
-                empty_streak += 1
-                if empty_streak >= 2:
-                    break
-            else:
-                empty_streak = 0
-                for col in data.keys():
-                    data[col].append(cells.get(col))
-            row += 1
-    else:
-        data = {}
-
-    workbook.close()
+        for col in columns:
+            cell = cells[positions[col]]
+            values[col].append(cell.value)
+            formats[col].append(cell.number_format)
+    # Cells become the text Excel displays, one column at a time
+    data = {col: render_column(values[col], formats[col]) for col in columns}
+
+    post = spec.get('post')
+    if post:
+        (SHEET_POST_HOOKS[post] if isinstance(post, str) else post)(data)
+    row_count = len(data[columns[0]])
+    for key, value in spec.get('constants', {}).items():
+        data[key] = [value] * row_count
     return data
 
 
+EMISSION_FACTOR_GASES = ["CO2", "CH4", "N2O", "HFCS", "PFCS", "SF6", "NF3"]
+
+# Output key -> 表5 column copied onto every gas row of a source row
+EMISSION_FACTOR_FIELDS = {
+    '範疇或類別': '排放類別',
+    '排放源': '排放源',
+    '係數來源': '係數來源',
+    '係數名稱': '係數名稱',
+}
+
+
+def reshape_emission_factors(df):
+    # Wide 表5 sheet (one column per gas) -> one long row per non-blank gas value,
+    # ordered by source row then gas. Works column-wise on an already-parsed sheet.
+    import numpy as np
+    import pandas as pd
+    df = df.dropna(subset=["排放類別"], how='all')
+    missing = pd.Series([None] * len(df), index=df.index, dtype=object)
+
+    present, formatted = [], []
+    for gas in EMISSION_FACTOR_GASES:
+        values = df[gas] if gas in df.columns else missing
+        present.append((values.notna() & (values.astype(str).str.strip() != '')).to_numpy())
+        numeric = pd.to_numeric(values, errors='coerce')
+        text = values.astype(str).where(numeric.isna(), numeric.map('{:.10f}'.format, na_action='ignore'))
+        formatted.append(text.to_numpy(dtype=object))
+
+    row_pos, gas_pos = np.nonzero(np.column_stack(present))  # row-major: source row, then gas
+    values = np.column_stack(formatted)[row_pos, gas_pos]
+
+    def field(column):
+        if column not in df.columns:
+            return [''] * len(row_pos)
+        return df[column].to_numpy()[row_pos]
+
+    final_df = pd.DataFrame({
+        '範疇或類別': field(EMISSION_FACTOR_FIELDS['範疇或類別']),
+        '排放源': field(EMISSION_FACTOR_FIELDS['排放源']),
+        '係數來源': field(EMISSION_FACTOR_FIELDS['係數來源']),
+        '係數名稱': field(EMISSION_FACTOR_FIELDS['係數名稱']),
+        '氣體': np.array(EMISSION_FACTOR_GASES, dtype=object)[gas_pos],
+        '溫室氣體排放係數': values,
+        '單位': field('單位'),
+    })
+    final_df = final_df.fillna("")
+    return {key: final_df[key].tolist() for key in final_df.columns}
+
+
+def _read_emission_factors(workbook, sheet_name, header):
+    return workbook.cached(
+        sheet_name, 'emission_factors', {'header': header},
+        lambda: reshape_emission_factors(workbook.dataframe(sheet_name, header=header)),
+    )
+
+
 def read_excel_data_pandas(excel_path, sheet_name):
-    df = pd.read_excel(excel_path, sheet_name=sheet_name, header=2)
-    data = {}
-    if sheet_name == '表5.排放係數':
-        df = df.dropna(subset=["排放類別"], how='all')
-        gases = ["CO2", "CH4", "N2O", "HFCS", "PFCS", "SF6", "NF3"]
-        transformed_rows = []
-        for _, row in df.iterrows():
-            has_valid_gas = any(pd.notna(row.get(gas)) and str(row.get(gas)).strip() != '' for gas in gases)
-            if not has_valid_gas:
-                continue
-            for gas in gases:
-                value = row.get(gas)
-                if pd.isna(value) or str(value).strip() == '':
-                    continue
-                num = pd.to_numeric(value, errors='coerce')
-                if pd.notna(num):
-                    formatted_value = f"{num:.10f}"
-                else:
-                    formatted_value = str(value)
-                transformed_rows.append({
-                    "範疇或類別": row.get("排放類別", ""),
-                    "排放源": row.get("排放源", ""),
-                    "係數來源": row.get("係數來源", ""),
-                    "係數名稱": row.get("係數名稱", ""),
-                    "氣體": gas,
-                    "溫室氣體排放係數": formatted_value,
-                    "單位": row.get("單位", "")
-                })
-        final_df = pd.DataFrame(transformed_rows)
-        final_df = final_df.fillna("")
-        data = {
-            '範疇或類別': final_df.get('範疇或類別', pd.Series([], dtype=str)).tolist(),
-            '排放源': final_df.get('排放源', pd.Series([], dtype=str)).tolist(),
-            '係數來源': final_df.get('係數來源', pd.Series([], dtype=str)).tolist(),
-            '係數名稱': final_df.get('係數名稱', pd.Series([], dtype=str)).tolist(),
-            '氣體': final_df.get('氣體', pd.Series([], dtype=str)).tolist(),
-            '溫室氣體排放係數': final_df.get('溫室氣體排放係數', pd.Series([], dtype=str)).tolist(),
-            '單位': final_df.get('單位', pd.Series([], dtype=str)).tolist()
-        }
-    return data
+    # excel_path may also be a WorkbookSnapshot that has already parsed the sheet
+    with _open_snapshot(excel_path) as workbook:
+        if sheet_name not in workbook:
+            raise ValueError(f"Sheet '{sheet_name}' not found. Available: {workbook.sheetnames}")
+        if sheet_name != '表5.排放係數':
+            return {}
+        return _read_emission_factors(workbook, sheet_name, 2)
 
 
 def read_excel_cell(excel_path, sheet_name, cell):
     try:
-        workbook = load_workbook(excel_path, data_only=True)
-        if sheet_name not in workbook.sheetnames:
-            workbook.close()
-            raise ValueError(f"Sheet '{sheet_name}' not found. Available: {workbook.sheetnames}")
-        sheet = workbook[sheet_name]
-        value = sheet[cell].value
-        workbook.close()
+        with _open_snapshot(excel_path) as workbook:
+            value = workbook.cell(sheet_name, cell).value
         return str(value) if value is not None else ''
     except Exception as e:
         print(f"讀取儲存格 {cell} 失敗: {str(e)}")
@@ -289,14 +560,14 @@ def read_excel_cell(excel_path, sheet_name, cell):
 
 def read_excel_cells(excel_path, sheet_name, cells):
     try:
-        workbook = load_workbook(excel_path, read_only=False, data_only=True)
-        if sheet_name not in workbook.sheetnames:
-            workbook.close()
-            raise ValueError(f"Sheet '{sheet_name}' not found. Available: {workbook.sheetnames}")
-        sheet = workbook[sheet_name]
-        values = {cell: format_value(sheet[cell]) for cell in cells}
-        workbook.close()
-        return values
+        with _open_snapshot(excel_path) as workbook:
+            cells = list(cells)
+
+            def read():
+                found = workbook[sheet_name].cells(cells)
+                return {cell: format_value(found[cell]) for cell in cells}
+
+            return workbook.cached(sheet_name, 'cells', cells, read)
     except Exception as e:
         print(f"批量讀取儲存格失敗: {str(e)}")
         return {cell: '' for cell in cells}
@@ -311,598 +582,721 @@ def add_table_row(table):
     table._tbl.append(tr)
 
 
-def fill_word_table(word_path, output_path, table_index, excel_data, cell_mapping, start_row=0):
-    doc = Document(word_path)
-    if table_index >= len(doc.tables):
-        raise IndexError(f"Template has only {len(doc.tables)} tables; requested index {table_index}")
-
-    table = doc.tables[table_index]
-
-    table.autofit = False
-    table.allow_autofit = False
-
-    # Set widths for all columns; extend defaults if needed
-    num_cols = len(table.columns)
-    column_widths = [COLUMN_WIDTH_DXA_DEFAULT] * num_cols
-    for col_idx, width in enumerate(column_widths):
-        for row in table.rows:
-            cell = row.cells[col_idx]
-            tc = cell._element
-            tcPr = tc.get_or_add_tcPr()
-            # Remove existing tcW to avoid duplicates
-            for child in list(tcPr):
-                if child.tag == qn('w:tcW'):
-                    tcPr.remove(child)
-            tcW = OxmlElement('w:tcW')
-            tcW.set(qn('w:w'), str(width))
-            tcW.set(qn('w:type'), 'dxa')
-            tcPr.append(tcW)
-
-    max_data_len = max((len(excel_data.get(key, [])) for key in cell_mapping.keys()), default=0)
-
-    required_rows = start_row + max_data_len
-    while len(table.rows) < required_rows:
-        add_table_row(table)
-
-    for key, (row_offset, col) in cell_mapping.items():
-        for i, value in enumerate(excel_data.get(key, [])):
-            cell = table.cell(start_row + i, col)
-
-            # Remove all existing paragraphs
-            for para in list(cell.paragraphs):
-                p = para._element
-                p.getparent().remove(p)
-
-            # Add new clean paragraph and run
-            new_para = cell.add_paragraph()
-            run = new_para.add_run(str(value).strip() if value is not None else '')
-            _set_run_style(run)
-
-            tc = cell._element
-            tcPr = tc.get_or_add_tcPr()
-            no_wrap = tcPr.find(qn('w:noWrap'))
-            if no_wrap is not None:
-                tcPr.remove(no_wrap)
-
-    doc.save(output_path)
-
-
-def replace_texts_in_word(word_path, output_path, replacements):
-    doc = Document(word_path)
-
-    for paragraph in doc.paragraphs:
-        original_text = paragraph.text
-        if not original_text:
+# ===== Fast table writer: works on w:tr / w:tc directly =====
+W14_ID_ATTRS = (
+    '{http://schemas.microsoft.com/office/word/2010/wordml}paraId',
+    '{http://schemas.microsoft.com/office/word/2010/wordml}textId',
+)
+
+
+def _table_grid(tbl, resolve_merges=True):
+    # Resolve the layout grid once: grid[r][c] is the w:tc holding the content of
+    # grid cell (r, c). Horizontal spans repeat their tc and vMerge="continue"
+    # cells point at the merge origin, as table.cell() does, unless
+    # resolve_merges is False (then every row keeps its own tc).
+    col_count = tbl.col_count
+    grid = []
+    for tr in tbl.tr_lst:
+        row = [None] * col_count
+        offset = tr.grid_before
+        for tc in tr.tc_lst:
+            span = tc.grid_span
+            origin = tc
+            if resolve_merges and tc.vMerge == ST_Merge.CONTINUE and grid and offset < col_count:
+                if grid[-1][offset] is not None:
+                    origin = grid[-1][offset]
+            for c in range(offset, min(offset + span, col_count)):
+                row[c] = origin
+            offset += span
+        grid.append(row)
+    return grid
+
+
+def _set_cell_widths(tbl, width):
+    # Fixed dxa width on every content cell; continuation cells of a vertical
+    # merge follow their origin
+    for tc in tbl.iter_tcs():
+        if tc.vMerge == ST_Merge.CONTINUE:
             continue
-        new_text = original_text
-        modified = False
-        for old_text, new_text_value in replacements:
-            if old_text in new_text:
-                new_text = new_text.replace(old_text, new_text_value)
-                modified = True
-        if modified:
-            _replace_paragraph_text(paragraph, new_text)
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                original_text = cell.text
-                if not original_text:
-                    continue
-                new_text = original_text
-                modified = False
-                for old_text, new_value in replacements:
-                    if old_text in new_text:
-                        new_text = new_text.replace(old_text, new_value)
-                        modified = True
-                if modified:
-                    # FULLY remove all paragraphs in the cell
-                    for para in list(cell.paragraphs):
-                        p = para._element
-                        p.getparent().remove(p)
-                    # Add clean paragraph
-                    paragraph = cell.add_paragraph()
-                    run = paragraph.add_run(new_text.strip())
-                    _set_run_style(run)
-
-    doc.save(output_path)
-
-
-def merge_cells_in_table_25(word_path, output_path, table_index=25):
-    doc = Document(word_path)
-    if table_index >= len(doc.tables):
-        raise IndexError(f"Template has only {len(doc.tables)} tables; requested index {table_index}")
-
-    table = doc.tables[table_index]
-
-    previous_source = None
-    merge_start = None
-
-    for row_idx in range(1, len(table.rows)):  # skip header
-        current_source = (table.cell(row_idx, 1).text or '').strip()
-
-        if current_source == previous_source:
+        tcPr = tc.get_or_add_tcPr()
+        tcWs = tcPr.findall(qn('w:tcW'))
+        for extra in tcWs[1:]:
+            tcPr.remove(extra)
+        tcW = tcPr.get_or_add_tcW()
+        tcW.set(qn('w:w'), str(width))
+        tcW.set(qn('w:type'), 'dxa')
+
+
+def _blank_row_like(tr):
+    # Copy of a data row with its row/cell properties (borders, shading, height)
+    # but no content, merge markers or Word paragraph ids
+    new_tr = deepcopy(tr)
+    for el in new_tr.iter():
+        for attr in W14_ID_ATTRS:
+            if attr in el.attrib:
+                del el.attrib[attr]
+    for tc in new_tr.tc_lst:
+        tcPr = tc.tcPr
+        if tcPr is not None:
+            vMerge = tcPr.find(qn('w:vMerge'))
+            if vMerge is not None:
+                tcPr.remove(vMerge)
+        first_p = tc.find(qn('w:p'))
+        pPr = first_p.find(qn('w:pPr')) if first_p is not None else None
+        for child in list(tc):
+            if child is not tcPr:
+                tc.remove(child)
+        p = OxmlElement('w:p')
+        if pPr is not None:
+            p.append(pPr)
+        tc.append(p)
+    return new_tr
+
+
+def _extend_table_rows(tbl, required_rows, start_row):
+    # Add all missing rows at once, cloned from the last existing data row so
+    # they keep the template's formatting; bare rows if there is no data row yet
+    trs = tbl.tr_lst
+    missing = required_rows - len(trs)
+    if missing <= 0:
+        return
+    if len(trs) > start_row:
+        prototype = _blank_row_like(trs[-1])
+    else:
+        prototype = OxmlElement('w:tr')
+        for _ in range(tbl.col_count):
+            tc = OxmlElement('w:tc')
+            tc.append(OxmlElement('w:p'))
+            prototype.append(tc)
+    tbl.extend(deepcopy(prototype) for _ in range(missing))
+
+
+def _styled_paragraph():
+    # <w:p> with one run carrying the report's run style; copied for every cell
+    p = OxmlElement('w:p')
+    _set_run_style(Run(p.add_r(), None))
+    return p
+
+
+def _write_cell(tc, text, paragraph_prototype):
+    for p in tc.p_lst:
+        tc.remove(p)
+    p = deepcopy(paragraph_prototype)
+    p.r_lst[0].text = text
+    tc.append(p)
+    tcPr = tc.get_or_add_tcPr()
+    no_wrap = tcPr.find(qn('w:noWrap'))
+    if no_wrap is not None:
+        tcPr.remove(no_wrap)
+
+
+def _clear_cell(tc):
+    # Continuation cells of a vertical merge hold a single empty paragraph
+    for p in tc.p_lst:
+        tc.remove(p)
+    tc.append(OxmlElement('w:p'))
+
+
+def _group_key(keys, i):
+    value = keys[i] if i < len(keys) else None
+    return str(value).strip() if value is not None else ''
+
+
+def _group_merge_states(keys, row_count):
+    # One vMerge value per row: RESTART opens a run of two or more equal keys,
+    # CONTINUE extends it, None leaves the row unmerged. Missing keys count as ''.
+    states = [None] * row_count
+    start = 0
+    for i in range(1, row_count + 1):
+        if i < row_count and _group_key(keys, i) == _group_key(keys, start):
             continue
-        else:
-            if merge_start is not None and row_idx - merge_start > 1:
-                for col in [0, 1, 2, 3]:  # columns to merge
-                    cell_to_merge = table.cell(merge_start, col)
-                    for merge_row in range(merge_start + 1, row_idx):
-                        # Clear text before merging
-                        table.cell(merge_row, col).text = ""
-                        cell_to_merge.merge(table.cell(merge_row, col))
-
-            previous_source = current_source
-            merge_start = row_idx
-
-    # Handle the last group
-    if merge_start is not None and len(table.rows) - merge_start > 1:
-        for col in [0, 1, 2, 3]:
-            cell_to_merge = table.cell(merge_start, col)
-            for merge_row in range(merge_start + 1, len(table.rows)):
-                table.cell(merge_row, col).text = ""
-                cell_to_merge.merge(table.cell(merge_row, col))
-
-    doc.save(output_path)
-
-
-def insert_if_empty_tables(word_path, output_path, table_indices):
-    doc = Document(word_path)
-
-    for table_index in table_indices:
-        if table_index >= len(doc.tables):
-            raise IndexError(f"Template has only {len(doc.tables)} tables; requested index {table_index}")
-        table = doc.tables[table_index]
-
-        # Check if all cells in data rows (excluding header) are empty
-        is_data_empty = True
-        for row in table.rows[1:]:  # assuming row 0 is the header
-            if any((cell.text or '').strip() for cell in row.cells):
-                is_data_empty = False
-                break
-
-        if is_data_empty:
-            # Make sure the table has at least two rows
-            while len(table.rows) < 2:
-                table.add_row()
-            target_cell = table.rows[1].cells[0]  # Insert into the first column
-            if target_cell.paragraphs:
-                target_cell.text = ""
-            paragraph = target_cell.add_paragraph()
-            run = paragraph.add_run("無")
-            _set_run_style(run)
-
-    doc.save(output_path)
-
-
-#Edit the FILEPATH by unhiding the def main() function below.
-def main_with_inputs(excel_path, word_path, output_folder, output_file_name):
-    # Ensure output folder exists
-    os.makedirs(output_folder, exist_ok=True)
-
-    output_path = os.path.join(output_folder, output_file_name)
-
-    start_cells = ['A13', 'C13', 'E13']
-
-    cell_mapping_table0 = {
-        'A': (0, 0),
-        'C': (0, 1),
-    }
-    cell_mapping_table1 = {
-        'K_category1': (0, 0),
-        'C_category1': (0, 1),
-    }
-    cell_mapping_table3 = {
-        'C_category3': (0, 0),
-    }
-    cell_mapping_table5 = {
-        'C_category5': (0, 0),
-    }
-
-    cell_mapping_table6 = {
-        'C_category6': (0, 0),
-    }
-
-    cell_mapping_table7 = {
-        'C_category7': (0, 0),
-    }
-
-    cell_mapping_table8 = {
-        'C_category8': (0, 0),
-    }
-
-    cell_mapping_table10 = {
-        'C_category10': (0, 0),
-    }
-
-    cell_mapping_table11 = {
-        'C_category11': (0, 0),
-    }
-    cell_mapping_table13 = {
-        'C_category13': (0, 0),
-    }
-    cell_mapping_table14 = {
-        'C_category14': (0, 0),
-    }
-    cell_mapping_table15 = {
-        'C_category15': (0, 0),
-    }
-    cell_mapping_table16 = {
-        'E': (0, 0),
-        'K': (0, 1),
-        'B': (0, 2),
-        'C': (0, 3)
-    }
-
-    cell_mapping_table23 = {
-        'C': (0, 0),
-        'I': (0, 1),
-        'others': (0, 2)
-    }
-
-    cell_mapping_table24 = {
-        'E': (0, 0),
-        'C': (0, 1),
-        'others': (0, 2)
-    }
-
-    cell_mapping_table25 = {
-        '範疇或類別': (0, 0),
-        '排放源': (0, 1),
-        '係數來源': (0, 2),
-        '係數名稱': (0, 3),
-        '氣體': (0, 4),
-        '溫室氣體排放係數': (0, 5),
-        '單位': (0, 6)
-    }
-
-    cell_mapping_table34 = {
-        'B': (0, 0),
-        'C': (0, 1),
-        'D': (0, 2),
-        'E': (0, 3),
-        'F': (0, 4),
-        'G': (0, 5),
-        'H': (0, 6),
-        'I': (0, 7),
-        'J': (0, 8)
-    }
-
-    # --- Fill tables ---
-    excel_data_table1 = read_excel_data(excel_path, '表1.基本資料', start_cells)
-    fill_word_table(
-        word_path=word_path,
-        output_path=output_path,
-        table_index=0,
-        excel_data=excel_data_table1,
-        cell_mapping=cell_mapping_table0,
-        start_row=1
-    )
-
-    excel_data_table2 = read_excel_data(excel_path, '表2.排放源鑑別', start_cells)
-
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=1,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table1,
-        start_row=1
-    )
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=3,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table3,
-        start_row=1
-    )
-
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=5,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table5,
-        start_row=1
-    )
-
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=6,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table6,
-        start_row=1
-    )
+        if i - start > 1:
+            states[start] = ST_Merge.RESTART
+            for j in range(start + 1, i):
+                states[j] = ST_Merge.CONTINUE
+        start = i
+    return states
+
+
+def _apply_group_merge(grid_rows, states, merge_columns):
+    # grid_rows come from _table_grid(tbl, resolve_merges=False)
+    for row, state in zip(grid_rows, states):
+        if state is None:
+            continue
+        for col in merge_columns:
+            tc = row[col]
+            tc.vMerge = state
+            if state == ST_Merge.CONTINUE:
+                _clear_cell(tc)
 
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=7,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table7,
-        start_row=1
-    )
 
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=8,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table8,
-        start_row=1
-    )
+def _table_rows(excel_data, cell_mapping):
+    # Data rows render_table writes
+    return max((len(excel_data.get(key, [])) for key in cell_mapping), default=0)
 
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=10,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table10,
-        start_row=1
-    )
 
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=11,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table11,
-        start_row=1
-    )
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=13,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table13,
-        start_row=1
-    )
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=14,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table14,
-        start_row=1
-    )
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=15,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table15,
-        start_row=1
-    )
+def render_table(table, excel_data, cell_mapping, start_row=0, group_merge=None):
+    # Writes the data into a python-docx Table and returns the number of data
+    # rows; touches nothing outside the table's w:tbl, so it also runs on a
+    # fragment (render_table_fragment)
+    tbl = table._tbl
 
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=16,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table16,
-        start_row=1
-    )
-
-    excel_data_table3 = read_excel_data(excel_path, '表3.活動數據', start_cells)
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=23,
-        excel_data=excel_data_table3,
-        cell_mapping=cell_mapping_table23,
-        start_row=1
-    )
+    table.autofit = False
+    table.allow_autofit = False
 
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=24,
-        excel_data=excel_data_table2,
-        cell_mapping=cell_mapping_table24,
-        start_row=1
-    )
+    # Set widths for all columns
+    _set_cell_widths(tbl, COLUMN_WIDTH_DXA_DEFAULT)
+
+    columns = {key: excel_data.get(key, []) for key in cell_mapping.keys()}
+    max_data_len = _table_rows(excel_data, cell_mapping)
+    _extend_table_rows(tbl, start_row + max_data_len, start_row)
+
+    # Grid is resolved once; values are written row by row in a single sweep
+    grid = _table_grid(tbl)
+    rows = grid[start_row:start_row + max_data_len]
+    states = [None] * max_data_len
+    merged = set()
+    if group_merge:
+        states = _group_merge_states(excel_data.get(group_merge['key'], []), max_data_len)
+        merged = set(group_merge['columns'])
+
+    paragraph_prototype = _styled_paragraph()
+    for i, row in enumerate(rows):
+        continued = states[i] == ST_Merge.CONTINUE
+        for key, (row_offset, col) in cell_mapping.items():
+            if continued and col in merged:
+                continue  # content lives in the merge origin
+            values = columns[key]
+            if i < len(values):
+                value = values[i]
+                _write_cell(row[col], str(value).strip() if value is not None else '', paragraph_prototype)
+
+    if merged:
+        own_rows = _table_grid(tbl, resolve_merges=False)[start_row:start_row + max_data_len]
+        _apply_group_merge(own_rows, states, sorted(merged))
+    return max_data_len
+
+
+def _table_data(excel_data, cell_mapping, group_merge=None):
+    # The columns of excel_data one table reads
+    keys = set(cell_mapping)
+    if group_merge:
+        keys.add(group_merge['key'])
+    return {key: excel_data[key] for key in keys if key in excel_data}
+
+
+def render_table_fragment(fragment, excel_data, cell_mapping, start_row=0, group_merge=None):
+    # Process pool job: render_table on a parsed copy of a table (see
+    # ReportSession.table_fragment) -> (serialized rendered table, data rows)
+    tbl = parse_xml(fragment)
+    rows = render_table(Table(tbl, None), excel_data, cell_mapping, start_row, group_merge)
+    return etree.tostring(tbl, encoding='utf-8'), rows
+
+
+def compile_replacements(replacements):
+    # (placeholder, value) pairs -> one alternation regex. Longer placeholders are
+    # tried first so e.g. 'Table6.2_D1' can never shadow 'Table6.2_D18'.
+    values = {}
+    for old_text, new_text in replacements:
+        if old_text:
+            values.setdefault(old_text, new_text)
+    if not values:
+        return None, values
+    alternation = '|'.join(re.escape(old_text) for old_text in sorted(values, key=len, reverse=True))
+    return re.compile(alternation), values
+
+
+# Unnamespaced attribute tagging placeholder paragraphs while their table is
+# rendered elsewhere; it never reaches a saved document
+FRAGMENT_MARK = 'ghgPlaceholder'
+
+
+class ReportSession:
+    # Opens the Word template once; every fill/merge/replace/empty-check stage
+    # works on the same in-memory document and save() writes it out once.
+    # compiled=True loads (or builds) the template's placeholder/table index so
+    # stages jump straight to the paragraphs and tables they rewrite.
+    # cache: a TemplateCache; the document is then a clone of the cached parsed
+    # template (always compiled) instead of a fresh Document(word_path).
+    # template: CompiledTemplate of the template word_path was built from, to
+    # reopen a finished report with the template's index (see restore_from_template).
+    def __init__(self, word_path, compiled=False, cache=None, template=None):
+        self.word_path = word_path
+        self.template = template
+        self._tables = None
+        self._registry = None
+        self._placeholder_paragraphs = None
+        if cache is not None:
+            self.doc, self.template = cache.open(word_path)
+        else:
+            self.doc = Document(word_path)
+            if compiled and template is None:
+                self.template = compile_template(word_path, self.doc)
+        if self.template is not None:
+            self._resolve_template()
+
+    @property
+    def indexed(self):
+        # True when the template index was bound to this document's elements
+        return self._placeholder_paragraphs is not None
+
+    def _resolve_template(self):
+        # Bind index paths to elements while the tree is still pristine; element
+        # references stay valid while rows are added and cells are merged.
+        document = self.doc.element
+        parts = {str(part.partname): part for part in iter_story_parts(self.doc)}
+        try:
+            tables = [resolve_path(document, t['path']) for t in self.template.tables]
+            paragraphs = []
+            for location in self.template.locations:
+                part = parts.get(location['part'])
+                p = resolve_path(part.element, location['path']) if part is not None else None
+                if p is None or p.tag != qn('w:p'):
+                    return False  # index does not match this document; fall back to full scans
+                paragraphs.append((part, p))
+        except IndexError:
+            return False
+        if any(tbl.tag != qn('w:tbl') for tbl in tables):
+            return False
+        self._tables = [Table(tbl, self.doc._body) for tbl in tables]
+        self._registry = self.template.registry
+        self._placeholder_paragraphs = paragraphs
+        return True
+
+    def restore_from_template(self, template_doc, tables=(), tokens=()):
+        # Put pristine copies of the given tables, and of every paragraph holding
+        # one of the tokens, back into a previously built report so they can be
+        # filled again. template_doc is an unmodified copy of the template.
+        # Returns False (document untouched) when the index does not fit.
+        if not self.indexed:
+            return False
+        tokens = set(tokens)
+        source = template_doc.element
+        for key in tables:
+            position = self.tables.index(key)
+            tbl = self._tables[position]._tbl
+            tbl.getparent().replace(tbl, deepcopy(resolve_path(source, self.template.tables[position]['path'])))
+        parts = {str(part.partname): part for part in iter_story_parts(template_doc)}
+        for location, (_, p) in zip(self.template.locations, self._placeholder_paragraphs):
+            if tokens.isdisjoint(location['tokens']) or p.getparent() is None:
+                continue
+            fresh = deepcopy(resolve_path(parts[location['part']].element, location['path']))
+            p.getparent().replace(p, fresh)
+        # Rebind: restored tables may themselves hold placeholder paragraphs
+        return self._resolve_template()
+
+    @property
+    def tables(self):
+        # Caption-keyed registry of the body tables, built once per document
+        if self._registry is None:
+            entries = scan_tables(self.doc.element)
+            document = self.doc.element
+            self._tables = [Table(resolve_path(document, t['path']), self.doc._body) for t in entries]
+            self._registry = TableRegistry(entries)
+        return self._registry
+
+    def _get_table(self, table):
+        # table: stable ID ('溫室氣體排放係數資訊彙整表'), full caption or position
+        position = self.tables.index(table)  # builds the registry and proxies on first use
+        return self._tables[position]
+
+    def fill_table(self, table_index, excel_data, cell_mapping, start_row=0, group_merge=None):
+        # table_index: position, stable ID or caption of the table (see tables)
+        # group_merge: {'key': data key, 'columns': [table columns]}; consecutive
+        # rows with the same key value are merged vertically in those columns
+        return render_table(self._get_table(table_index), excel_data, cell_mapping, start_row, group_merge)
+
+    def table_fragment(self, table_index):
+        # Serialized w:tbl to render in another process. Indexed placeholder
+        # paragraphs inside it carry FRAGMENT_MARK so splice_table can rebind them.
+        tbl = self._get_table(table_index)._tbl
+        marked = []
+        for i, (_, p) in enumerate(self._placeholder_paragraphs or ()):
+            if any(ancestor is tbl for ancestor in p.iterancestors(qn('w:tbl'))):
+                p.set(FRAGMENT_MARK, str(i))
+                marked.append(p)
+        try:
+            return etree.tostring(tbl, encoding='utf-8')
+        finally:
+            for p in marked:
+                del p.attrib[FRAGMENT_MARK]
+
+    def splice_table(self, table_index, fragment):
+        # Moves the content of a rendered fragment into the table. The w:tbl
+        # element itself stays, so references to it remain valid and the
+        # content falls under the document's namespace declarations.
+        tbl = self._get_table(table_index)._tbl
+        rendered = parse_xml(fragment)
+        for child in list(tbl):
+            tbl.remove(child)
+        tbl.extend(list(rendered))
+        for p in tbl.iterfind(f".//{qn('w:p')}[@{FRAGMENT_MARK}]"):
+            i = int(p.attrib.pop(FRAGMENT_MARK))
+            self._placeholder_paragraphs[i] = (self._placeholder_paragraphs[i][0], p)
+
+    def _paragraphs_for(self, tokens):
+        # Indexed placeholder paragraphs when every token is known to the
+        # compiled template, otherwise every w:p of every story part
+        if self._placeholder_paragraphs is not None and tokens <= self.template.tokens:
+            for part, p in self._placeholder_paragraphs:
+                if p.getroottree().getroot() is part.element:  # skip paragraphs a fill removed
+                    yield part, p
+            return
+        for part in iter_story_parts(self.doc):
+            for p in part.element.iter(qn('w:p')):
+                yield part, p
+
+    def replace_texts(self, replacements):
+        # One pass over every w:p (body, table cells, text boxes, headers,
+        # footers) matching all placeholders at once
+        pattern, values = compile_replacements(replacements)
+        if pattern is None:
+            return
+        for part, p in self._paragraphs_for(values.keys()):
+            paragraph = Paragraph(p, part)
+            original_text = paragraph.text
+            if not original_text or pattern.search(original_text) is None:
+                continue
+            new_text = pattern.sub(lambda m: values[m.group(0)], original_text)
+            if p.getparent().tag == qn('w:tc'):
+                new_text = new_text.strip()  # table cells hold bare values
+            _replace_paragraph_text(paragraph, new_text)
 
-    excel_data_table5 = read_excel_data_pandas(excel_path, '表5.排放係數')
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=25,
-        excel_data=excel_data_table5,
-        cell_mapping=cell_mapping_table25,
-        start_row=1
-    )
+    def merge_cells_in_table_25(self, table_index=25):
+        # For a table filled without group_merge: groups rows below the header by
+        # the 排放源 text in column 1 and merges columns 0-3 of each group
+        tbl = self._get_table(table_index)._tbl
+        keys = [''.join(row[1].itertext()) for row in _table_grid(tbl)[1:]]  # skip header
+        rows = _table_grid(tbl, resolve_merges=False)[1:]
+        merge_columns = TABLE_GROUP_MERGES[EMISSION_FACTOR_TABLE]['columns']
+        _apply_group_merge(rows, _group_merge_states(keys, len(rows)), merge_columns)
+
+    def insert_if_empty_tables(self, table_indices):
+        for table_index in table_indices:
+            table = self._get_table(table_index)
+
+            # Check if all cells in data rows (excluding header) are empty
+            is_data_empty = True
+            for row in table.rows[1:]:  # assuming row 0 is the header
+                if any((cell.text or '').strip() for cell in row.cells):
+                    is_data_empty = False
+                    break
 
-    merge_cells_in_table_25(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=25
-    )
+            if is_data_empty:
+                # Make sure the table has at least two rows
+                while len(table.rows) < 2:
+                    table.add_row()
+                target_cell = table.rows[1].cells[0]  # Insert into the first column
+                if target_cell.paragraphs:
+                    target_cell.text = ""
+                paragraph = target_cell.add_paragraph()
+                run = paragraph.add_run("無")
+                _set_run_style(run)
 
-    excel_data_table8 = read_excel_data(excel_path, '表8.不確定分析', start_cells)
-    fill_word_table(
-        word_path=output_path,
-        output_path=output_path,
-        table_index=34,
-        excel_data=excel_data_table8,
-        cell_mapping=cell_mapping_table34,
-        start_row=1
-    )
+    def save(self, output_path):
+        self.doc.save(output_path)
 
-    # --- Replace placeholders from various sheets ---
-    replacement_cells_62 = [
-        ('Table6.2_D5', 'D5'),
-        ('Table6.2_D6', 'D6'),
-        ('Table6.2_D7', 'D7'),
-        ('Table6.2_D8', 'D8'),
-        ('Table6.2_D9', 'D9'),
-        ('Table6.2_D10', 'D10'),
-        ('Table6.2_D11', 'D11'),
-        ('Table6.2_D17', 'D17'),
-        ('Table6.2_D18', 'D18'),
-        ('Table6.2_D19', 'D19'),
-        ('Table6.2_D20', 'D20'),
-        ('Table6.2_D21', 'D21'),
-        ('Table6.2_D22', 'D22'),
-        ('Table6.2_D23', 'D23'),
-        ('Table6.2_D24', 'D24'),
-        ('Table6.2_D25', 'D25'),
-        ('Table6.2_D26', 'D26'),
-        ('Table6.2_D27', 'D27'),
-        ('Table6.2_D28', 'D28'),
-        ('Table6.2_D29', 'D29'),
-        ('Table6.2_D30', 'D30'),
-        ('Table6.2_D31', 'D31'),
-        ('Table6.2_D32', 'D32'),
-        ('Table6.2_D33', 'D33')
-    ]
 
-    cell_values_62 = read_excel_cells(
-        excel_path,
-        '表6.2溫室氣體排放量 (範疇1&2, 類別1-15)',
-        [cell for _, cell in replacement_cells_62]
-    )
+# ===== Single-shot wrappers: open, run one stage, save =====
+def fill_word_table(word_path, output_path, table_index, excel_data, cell_mapping, start_row=0, group_merge=None):
+    session = ReportSession(word_path)
+    session.fill_table(table_index, excel_data, cell_mapping, start_row, group_merge)
+    session.save(output_path)
 
-    replacements_62 = [(old_text, cell_values_62[cell]) for old_text, cell in replacement_cells_62]
 
-    replace_texts_in_word(
-        word_path=output_path,
-        output_path=output_path,
-        replacements=replacements_62
-    )
+def replace_texts_in_word(word_path, output_path, replacements):
+    session = ReportSession(word_path)
+    session.replace_texts(replacements)
+    session.save(output_path)
 
-    replacement_cells_61 = [
-        ('Table6.1_J4', 'J4'),
-        ('Table6.1_C24', 'C24'),
-        ('Table6.1_C25', 'C25'),
-        ('Table6.1_G21', 'G21'),
-        ('Table6.1_H21', 'H21'),
-        ('Table6.1_J21', 'J21'),
-        ('Table6.1_K21', 'K21'),
-        ('Table6.1_G22', 'G22'),
-        ('Table6.1_H23', 'H23'),
-        ('Table6.1_C13', 'C13'),
-        ('Table6.1_D13', 'D13'),
-        ('Table6.1_E13', 'E13'),
-        ('Table6.1_F13', 'F13'),
-        ('Table6.1_G13', 'G13'),
-        ('Table6.1_H13', 'H13'),
-        ('Table6.1_I13', 'I13'),
-        ('Table6.1_C15', 'C15'),
-        ('Table6.1_D15', 'D15'),
-        ('Table6.1_E15', 'E15'),
-        ('Table6.1_F15', 'F15'),
-        ('Table6.1_G15', 'G15'),
-        ('Table6.1_H15', 'H15'),
-        ('Table6.1_I15', 'I15'),
-        ('Table6.1_C21', 'C21'),
-        ('Table6.1_D21', 'D21'),
-        ('Table6.1_E21', 'E21'),
-        ('Table6.1_F21', 'F21'),
-        ('Table6.1_C22', 'C22'),
-        ('Table6.1_D22', 'D22'),
-        ('Table6.1_E22', 'E22'),
-        ('Table6.1_F22', 'F22'),
-        ('Table6.1_C23', 'C23'),
-        ('Table6.1_D23', 'D23'),
-        ('Table6.1_E23', 'E23'),
-        ('Table6.1_F23', 'F23'),
-        ('Table6.1_G23', 'G23'),
-        ('Table6.1_H22', 'H22')
-    ]
 
-    cell_values_61 = read_excel_cells(
-        excel_path,
-        '表6.1溫室氣體排放量(範疇1-2)',
-        [cell for _, cell in replacement_cells_61]
-    )
+def merge_cells_in_table_25(word_path, output_path, table_index=25):
+    session = ReportSession(word_path)
+    session.merge_cells_in_table_25(table_index)
+    session.save(output_path)
 
-    replacements_61 = [(old_text, cell_values_61[cell]) for old_text, cell in replacement_cells_61]
 
-    replace_texts_in_word(
-        word_path=output_path,
-        output_path=output_path,
-        replacements=replacements_61
+def insert_if_empty_tables(word_path, output_path, table_indices):
+    session = ReportSession(word_path)
+    session.insert_if_empty_tables(table_indices)
+    session.save(output_path)
+
+
+# ===== Plan execution: report_mapping.json compiled by report_plan =====
+def read_sheet_plan(workbook, sheet_plan):
+    # Extracted data for one planned sheet
+    if sheet_plan.reader == 'emission_factors':
+        return _read_emission_factors(workbook, sheet_plan.name, sheet_plan.spec['header'])
+    return workbook.cached(
+        sheet_plan.name, 'rows', sheet_plan.spec, lambda: extract_sheet(workbook[sheet_plan.name], sheet_plan.spec)
     )
 
-    replacement_cells_7 = [
-        ('Table7_O2', 'O2'),
-        ('Table7_Q2', 'Q2')
-    ]
-
-    cell_values_7 = read_excel_cells(
-        excel_path,
-        '表7.數據品質分析',
-        [cell for _, cell in replacement_cells_7]
-    )
 
-    replacements_7 = [(old_text, cell_values_7[cell]) for old_text, cell in replacement_cells_7]
+def _extract_in_process(excel_path, backend, reader, *args):
+    # Process pool job: reader(snapshot, *args) on the worker's own mapping of
+    # the workbook, with its extract cache hits and misses
+    with WorkbookSnapshot(excel_path, backend=backend) as workbook:
+        return reader(workbook, *args), workbook.cache_hits, workbook.cache_misses
 
-    replace_texts_in_word(
-        word_path=output_path,
-        output_path=output_path,
-        replacements=replacements_7
-    )
 
-    replacement_cells_8 = [
-        ('Table8_A23', 'A23'),
-        ('Table8_C23', 'C23'),
-        ('Table8_E23', 'E23')
-    ]
+def _process_pool(workers):
+    # Spawned, not forked: the build has other threads running (template
+    # loader, sheet pool) whose locks a forked child would inherit mid-use
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
 
-    cell_values_8 = read_excel_cells(
-        excel_path,
-        '表8.不確定分析',
-        [cell for _, cell in replacement_cells_8]
-    )
 
-    replacements_8 = [(old_text, cell_values_8[cell]) for old_text, cell in replacement_cells_8]
+def _worker_ready():
+    return os.getpid()
 
-    replace_texts_in_word(
-        word_path=output_path,
-        output_path=output_path,
-        replacements=replacements_8
-    )
 
-    replacement_cells_1 = [
-        ('rb_version', 'B2'),
-        ('rb_published_year', 'D2'),
-        ('rb_published_month', 'D3'),
-        ('rb_company_name', 'B5'),
-        ('rb_company_address', 'B6'),
-        ('rb_initiating_year', 'B8'),
-        ('rb_base_year', 'B9'),
-        ('rb_reporting_year', 'B10'),
-        ('rb_reporting_period', 'B11'),
-        ('rb_contact_name', 'B12'),
-        ('rb_contact_dept', 'B13'),
-        ('rb_contact_phone', 'B14'),
-        ('rb_contact_email', 'B15')
+@contextmanager
+def open_sheet_pool(kind=None, workers=None):
+    # Executor for SheetExtraction, one of SHEET_POOLS (default SHEET_POOL);
+    # reads still queued when the build stops early are cancelled. Yields None
+    # for a single worker: on one core the reads only compete with the build
+    # thread for the GIL, so they run inline instead.
+    kind = kind or SHEET_POOL
+    if kind not in SHEET_POOLS:
+        raise ValueError(f"Unknown sheet pool '{kind}'. Available: {SHEET_POOLS}")
+    workers = workers or SHEET_WORKERS
+    if workers < 2:
+        yield None
+        return
+    if kind == 'process':
+        pool = _process_pool(workers)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sheet')
+    try:
+        yield pool
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+@contextmanager
+def open_render_pool(mode=None, workers=None):
+    # Process pool for run_plan's fragment rendering, None when mode (default
+    # TABLE_RENDER) is 'serial' or there is a single worker. The workers are
+    # started (and import this module) right away, while the build is still
+    # loading the template and reading sheets.
+    mode = mode or TABLE_RENDER
+    if mode not in TABLE_RENDER_MODES:
+        raise ValueError(f"Unknown table render mode '{mode}'. Available: {TABLE_RENDER_MODES}")
+    workers = workers or SHEET_WORKERS
+    if mode == 'serial' or workers < 2:
+        yield None
+        return
+    pool = _process_pool(workers)
+    for _ in range(workers):
+        pool.submit(_worker_ready)
+    try:
+        yield pool
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class SheetExtraction:
+    # The workbook reads of a plan (sheet extractions and placeholder cells),
+    # queued on a pool ahead of the table fills. run_plan takes each result when
+    # it needs it, so the build waits at most for the slowest sheet; reads that
+    # were never queued (or without a pool) run inline.
+    def __init__(self, workbook, pool=None):
+        self.workbook = workbook
+        self.pool = pool
+        self._processes = isinstance(pool, ProcessPoolExecutor)
+        self._sheets = {}
+        self._cells = {}
+
+    def _submit(self, reader, *args):
+        if self._processes:
+            return self.pool.submit(_extract_in_process, self.workbook.excel_path, self.workbook.backend,
+                                    reader, *args)
+        return self.pool.submit(reader, self.workbook, *args)
+
+    def _result(self, future):
+        if not self._processes:
+            return future.result()
+        value, hits, misses = future.result()
+        self.workbook.count_cache(hits, misses)
+        return value
+
+    def submit(self, plan, sheets=None):
+        # Queues every read of plan (only those of sheets, when given) that is not
+        # queued yet; plan may be compiled without a template, which leaves out
+        # placeholders but plans the same sheet reads
+        if self.pool is None:
+            return
+        for sheet_plan in plan.sheets:
+            if (sheets is None or sheet_plan.name in sheets) and sheet_plan.name not in self._sheets:
+                self._sheets[sheet_plan.name] = (sheet_plan, self._submit(read_sheet_plan, sheet_plan))
+        for sheet_name, items in plan.placeholders.items():
+            cells = [cell for _, cell in items]
+            if (sheets is None or sheet_name in sheets) and sheet_name not in self._cells:
+                self._cells[sheet_name] = (cells, self._submit(read_excel_cells, sheet_name, cells))
+
+    def sheet(self, sheet_plan):
+        queued = self._sheets.get(sheet_plan.name)
+        if queued is not None and (queued[0].reader, queued[0].spec) == (sheet_plan.reader, sheet_plan.spec):
+            return self._result(queued[1])
+        return read_sheet_plan(self.workbook, sheet_plan)
+
+    def cells(self, sheet_name, cells):
+        queued = self._cells.get(sheet_name)
+        if queued is not None and queued[0] == cells:
+            return self._result(queued[1])
+        return read_excel_cells(self.workbook, sheet_name, cells)
+
+
+def run_plan(plan, session, workbook, sheets=None, placeholder_values=None, instrumentation=None, extraction=None,
+             render_pool=None):
+    # Each sheet is read once and fills all of its tables; placeholders from
+    # every sheet are then replaced in one pass.
+    # sheets: only these sheets are read (their tables and placeholders must be
+    # pristine again, see ReportSession.restore_from_template); other tokens
+    # take their text from placeholder_values. Returns token -> text.
+    # instrumentation: optional BuildInstrumentation told about every stage
+    # extraction: SheetExtraction over workbook with reads already queued
+    # (read_sheet/read_cells then time the wait for them)
+    # render_pool: open_render_pool executor; tables of TABLE_RENDER_MIN_ROWS
+    # rows or more are rendered there while the next sheets are read, and
+    # spliced in before the placeholders are replaced
+    if extraction is None:
+        extraction = SheetExtraction(workbook)
+    rendering = []
+    for sheet_plan in plan.sheets:
+        if sheets is not None and sheet_plan.name not in sheets:
+            continue
+        with stage(instrumentation, 'read_sheet', sheet=sheet_plan.name) as attrs:
+            excel_data = extraction.sheet(sheet_plan)
+            attrs['rows'] = len(next(iter(excel_data.values()), []))
+        for table in sheet_plan.tables:
+            if render_pool is not None and _table_rows(excel_data, table.cell_mapping) >= TABLE_RENDER_MIN_ROWS:
+                data = _table_data(excel_data, table.cell_mapping, table.group_merge)
+                rendering.append((sheet_plan.name, table, render_pool.submit(
+                    render_table_fragment, session.table_fragment(table.table), data, table.cell_mapping,
+                    table.start_row, table.group_merge,
+                )))
+                continue
+            with stage(instrumentation, 'fill_table', sheet=sheet_plan.name, table=table.table,
+                       index=table.index) as attrs:
+                attrs['rows'] = session.fill_table(
+                    table_index=table.table,
+                    excel_data=excel_data,
+                    cell_mapping=table.cell_mapping,
+                    start_row=table.start_row,
+                    group_merge=table.group_merge
+                )
+    for sheet_name, table, future in rendering:
+        with stage(instrumentation, 'fill_table', sheet=sheet_name, table=table.table, index=table.index,
+                   render='process') as attrs:
+            fragment, attrs['rows'] = future.result()
+            session.splice_table(table.table, fragment)
+
+    values = dict(placeholder_values or {})
+    for sheet_name, replacement_cells in plan.placeholders.items():
+        if sheets is not None and sheet_name not in sheets:
+            continue
+        with stage(instrumentation, 'read_cells', sheet=sheet_name, rows=len(replacement_cells)):
+            cell_values = extraction.cells(sheet_name, [cell for _, cell in replacement_cells])
+        values.update((old_text, cell_values[cell]) for old_text, cell in replacement_cells)
+    with stage(instrumentation, 'replace_texts', rows=len(values)):
+        session.replace_texts(values.items())
+
+    empty_check_tables = [
+        table.table for table in plan.tables
+        if table.empty_check and (sheets is None or table.sheet in sheets)
     ]
+    if empty_check_tables:
+        with stage(instrumentation, 'empty_checks', rows=len(empty_check_tables)):
+            session.insert_if_empty_tables(empty_check_tables)
+    return values
 
-    cell_values_1 = read_excel_cells(
-        excel_path,
-        '表1.基本資料',
-        [cell for _, cell in replacement_cells_1]
-    )
 
-    replacements_1 = [(old_text, cell_values_1[cell]) for old_text, cell in replacement_cells_1]
+def _reopen_report(output_path, word_path, template, manifest, sheets):
+    # Previous output with the parts fed by the changed sheets reset to the
+    # template's; None when it cannot be matched to the template index
+    session = ReportSession(output_path, template=template)
+    tables, tokens = manifest.affected(sheets)
+    template_doc, _ = TEMPLATE_CACHE.open(word_path)
+    if not session.restore_from_template(template_doc, tables, tokens):
+        return None
+    return session
 
-    replace_texts_in_word(
-        word_path=output_path,
-        output_path=output_path,
-        replacements=replacements_1
-    )
 
-    empty_check_tables = [1, 3, 5, 6, 7, 8, 10, 11, 13, 14, 15]
-    insert_if_empty_tables(
-        word_path=output_path,
-        output_path=output_path,
-        table_indices=empty_check_tables
-    )
+#Edit the FILEPATH by unhiding the def main() function below.
+def main_with_inputs(excel_path, word_path, output_folder, output_file_name, mapping_path=DEFAULT_MAPPING_PATH,
+                     incremental=True, instrumentation=None):
+    # incremental: rebuild only what depends on sheets that changed since the
+    # last build of the same output (see report_manifest); False forces a full build
+    # instrumentation: optional BuildInstrumentation (build_instrumentation) that
+    # receives start/end events with timings for every stage of the build
+    # Ensure output folder exists
+    os.makedirs(output_folder, exist_ok=True)
 
-    print(f"Word saved as {output_file_name} at {output_path}")
+    output_path = os.path.join(output_folder, output_file_name)
+    manifest = load_manifest(output_path) if incremental else None
+
+    # The template loads on its own thread while the workbook is mapped and its
+    # sheets are extracted on the sheet pool; the table fills then wait only for
+    # what has not finished yet. One snapshot is shared by every Excel reader.
+    # With TABLE_RENDER 'process' the large tables render on worker processes
+    # that start up meanwhile.
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='template') as loader, \
+            WorkbookSnapshot(excel_path) as workbook, open_sheet_pool() as pool, \
+            open_render_pool() as render_pool:
+        template_future = loader.submit(TEMPLATE_CACHE.compiled, word_path)
+        extraction = SheetExtraction(workbook, pool)
+        if manifest is None:
+            # Full build: every planned sheet is read, whatever the template holds
+            extraction.submit(PLAN_CACHE.get(mapping_path))
+
+        with stage(instrumentation, 'template'):
+            template = template_future.result()
+        # Sheet -> tables and placeholder -> cell layout, compiled once per mapping file
+        with stage(instrumentation, 'plan'):
+            plan = PLAN_CACHE.get(mapping_path, template)
+            signature = plan_signature(plan)
+            dependencies = plan_dependencies(plan)
+        with stage(instrumentation, 'source_hashes', rows=len(dependencies)):
+            sources = workbook.source_hashes(list(dependencies))
+
+        changed = None
+        if manifest is not None:
+            changed = manifest.changed_sheets(template.template_hash, signature, sources, output_path)
+        if changed is not None and not changed:
+            print(f"{output_file_name} is up to date at {output_path}")
+            return
+        extraction.submit(plan, sheets=changed)
+
+        with stage(instrumentation, 'open_report') as attrs:
+            session = None
+            if changed is not None:
+                session = _reopen_report(output_path, word_path, template, manifest, changed)
+            if session is None:
+                changed = None
+                extraction.submit(plan)
+                # One in-memory document for every stage; saved once at the end
+                session = ReportSession(word_path, cache=TEMPLATE_CACHE)
+            attrs['mode'] = 'incremental' if changed else 'full'
+
+        values = run_plan(plan, session, workbook, sheets=changed,
+                          placeholder_values=manifest.placeholder_values if changed else None,
+                          instrumentation=instrumentation, extraction=extraction, render_pool=render_pool)
+    EXTRACT_CACHE.record_stats()
+
+    with stage(instrumentation, 'save'):
+        discard_manifest(output_path)  # a failed save must not leave a matching manifest behind
+        session.save(output_path)
+        save_manifest(output_path, BuildManifest(
+            os.path.abspath(excel_path), template.template_hash, signature, file_sha256(output_path), sources,
+            dependencies, values,
+        ))
+
+    if changed:
+        print(f"Word saved as {output_file_name} at {output_path} (updated from: {', '.join(sorted(changed))})")
+    else:
+        print(f"Word saved as {output_file_name} at {output_path}")
+    if workbook.cache is not None:
+        print(f"Sheet data cache: {workbook.cache_hits} hits, {workbook.cache_misses} misses")
 
 
 if __name__ == "__main__":
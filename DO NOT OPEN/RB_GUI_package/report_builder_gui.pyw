@@ -1,17 +1,45 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
+import multiprocessing
 import threading
 import os
 import json
 import traceback
 import sys  # NEW: for resource_path
 
-# IMPORTANT: your backend module that exposes main_with_inputs(...)
-import report_builder
-
 APP_TITLE = "GHG Report Builder"
 SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".ghg_report_builder_gui.json")
+# Set by other helpers/startup_benchmark.py: print startup milestones, then quit
+STARTUP_PROBE_ENV = "GHG_REPORT_BUILDER_STARTUP_PROBE"
+
+# ---------- Backend (imported lazily) ----------
+# report_builder pulls in python-docx and openpyxl, which takes seconds in the
+# frozen build. The window is shown first; the import then runs on a
+# background thread, and Run waits for it if it has not finished yet.
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def load_backend():
+    """Import report_builder once (thread-safe) and return the module."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            # IMPORTANT: your backend module that exposes main_with_inputs(...)
+            import report_builder
+            _backend = report_builder
+    return _backend
+
+def warm_backend(on_ready=None):
+    def worker():
+        try:
+            load_backend()
+        except Exception:
+            return  # reported with its traceback when Run imports it again
+        if on_ready is not None:
+            on_ready()
+    threading.Thread(target=worker, daemon=True).start()
 
 # ---------- Helpers for packaging (works in dev & PyInstaller) ----------
 
@@ -47,8 +75,18 @@ def set_running(btns, running: bool, note_var: tk.StringVar, note: str = ""):
 
 def run_builder_worker(excel_file, word_template, output_folder, output_filename, btns, note_var):
     try:
+        if _backend is None:
+            set_running(btns, True, note_var, "Loading…")
+        backend = load_backend()
+        from build_instrumentation import BuildInstrumentation
         set_running(btns, True, note_var, "Working… this may take a minute.")
 
+        # Show which stage the build is in (same events batch runs can record)
+        def show_stage(event):
+            if event.phase == "start":
+                note_var.set(f"Working… {event.describe()}")
+        instrumentation = BuildInstrumentation([show_stage])
+
         # Ensure .docx extension
         if not output_filename.lower().endswith(".docx"):
             output_filename += ".docx"
@@ -56,11 +94,12 @@ def run_builder_worker(excel_file, word_template, output_folder, output_filename
         # Ensure output folder exists
         os.makedirs(output_folder, exist_ok=True)
 
-        report_builder.main_with_inputs(
+        backend.main_with_inputs(
             excel_path=excel_file,
             word_path=word_template,
             output_folder=output_folder,
-            output_file_name=output_filename
+            output_file_name=output_filename,
+            instrumentation=instrumentation,
         )
 
         save_settings({
@@ -202,7 +241,25 @@ def build_gui():
     btns_adv = [btn_adv_run]
     btn_adv_run.config(command=lambda: run_advanced(btns_adv, status_var, excel_var, word_var, outdir_var, name_var))
 
+    if os.environ.get(STARTUP_PROBE_ENV):
+        start_startup_probe(root)
+    else:
+        # Import the backend once the window has painted
+        root.after(100, warm_backend)
+
     root.mainloop()
 
+def start_startup_probe(root):
+    # Prints "window" once the window is first mapped and "backend" once the
+    # backend import has finished, then closes; the benchmark timestamps the lines
+    def on_map(event):
+        if event.widget is root and not getattr(root, "_probe_mapped", False):
+            root._probe_mapped = True
+            print("window", flush=True)
+            warm_backend(on_ready=lambda: (print("backend", flush=True), root.after(0, root.destroy)))
+
+    root.bind("<Map>", on_map)
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PyInstaller builds with GHG_REPORT_BUILDER_SHEET_POOL=process
     build_gui()
@@ -5,7 +5,7 @@ a = Analysis(
     ['report_builder_gui.pyw'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('report_mapping.json', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,217 @@
+# Build manifests for incremental report rebuilds. After each build the builder
+# records, per output file, what the output was made from: the template hash,
+# the plan, a content hash of every source sheet's XML part and which tables
+# and placeholders each sheet feeds. The next build of the same output compares
+# hashes and regenerates only what depends on a changed sheet; when nothing
+# changed it does nothing at all. A manifest written by a builder that renders
+# differently (see BUILDER_VERSION) always leads to a full rebuild.
+#
+# Manifests live in the builder cache (CACHE_DIR/builds), keyed by the output's
+# absolute path, so output folders stay clean.
+
+import hashlib
+import json
+import os
+import posixpath
+import zipfile
+
+from lxml import etree
+
+from extract_cache import EXTRACT_CACHE_VERSION
+from report_template import CACHE_DIR, file_sha256
+
+MANIFEST_VERSION = 1
+
+# Bump RENDER_VERSION whenever the same inputs build a different report (table
+# filling, placeholder replacement, empty checks); changes to extraction and
+# value rendering bump EXTRACT_CACHE_VERSION, which is part of BUILDER_VERSION
+RENDER_VERSION = 1
+BUILDER_VERSION = f"{RENDER_VERSION}.{EXTRACT_CACHE_VERSION}"
+
+# Parts every sheet reads through: cell strings and number formats. A change
+# here can alter any sheet without touching its own XML.
+SHARED_WORKBOOK_PARTS = ('xl/sharedStrings.xml', 'xl/styles.xml')
+
+_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_DOC_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_OFFICE_DOCUMENT = _DOC_REL_NS + '/officeDocument'
+
+
+def _rels_targets(zf, part_name):
+    # Relationship Id -> absolute part name for the rels of part_name
+    folder, name = posixpath.split(part_name)
+    rels_name = posixpath.join(folder, '_rels', name + '.rels')
+    root = etree.fromstring(zf.read(rels_name))
+    targets = {}
+    for rel in root.iter(f'{{{_REL_NS}}}Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        if target.startswith('/'):
+            targets[rel.get('Id')] = (rel.get('Type'), target.lstrip('/'))
+        else:
+            targets[rel.get('Id')] = (rel.get('Type'), posixpath.normpath(posixpath.join(folder, target)))
+    return targets
+
+
+def workbook_part(zf):
+    # Part name of the workbook itself (normally xl/workbook.xml)
+    return next(target for rel_type, target in _rels_targets(zf, '').values() if rel_type == _OFFICE_DOCUMENT)
+
+
+def workbook_sheet_parts(zf):
+    # {sheet name: part name inside the .xlsx}
+    part_name = workbook_part(zf)
+    targets = _rels_targets(zf, part_name)
+    root = etree.fromstring(zf.read(part_name))
+    parts = {}
+    for sheet in root.iter(f'{{{_SHEET_NS}}}sheet'):
+        target = targets.get(sheet.get(f'{{{_DOC_REL_NS}}}id'))
+        if target is not None:
+            parts[sheet.get('name')] = target[1]
+    return parts
+
+
+def _part_hash(zf, part_name):
+    try:
+        data = zf.read(part_name)
+    except KeyError:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def shared_parts_hash(zf):
+    shared = hashlib.sha256()
+    for part_name in SHARED_WORKBOOK_PARTS:
+        shared.update(f"{part_name}:{_part_hash(zf, part_name)};".encode('utf-8'))
+    return shared.hexdigest()
+
+
+def sheet_part_hash(zf, sheet_parts, sheet_name):
+    part_name = sheet_parts.get(sheet_name)
+    return _part_hash(zf, part_name) if part_name is not None else None
+
+
+def source_hashes(excel_path, sheet_names):
+    # {'sheets': {sheet: sha256 of its XML part or None}, 'shared': sha256 of the shared parts}
+    with zipfile.ZipFile(excel_path) as zf:
+        parts = workbook_sheet_parts(zf)
+        sheets = {name: sheet_part_hash(zf, parts, name) for name in sheet_names}
+        shared = shared_parts_hash(zf)
+    return {'sheets': sheets, 'shared': shared}
+
+
+def plan_dependencies(plan):
+    # {sheet: {'tables': [table keys], 'placeholders': [tokens]}} for every sheet the plan reads
+    dependencies = {}
+    for table in plan.tables:
+        dependencies.setdefault(table.sheet, {'tables': [], 'placeholders': []})['tables'].append(table.table)
+    for sheet, items in plan.placeholders.items():
+        entry = dependencies.setdefault(sheet, {'tables': [], 'placeholders': []})
+        entry['placeholders'].extend(token for token, _ in items)
+    return dependencies
+
+
+def plan_signature(plan):
+    encoded = json.dumps(plan.to_dict(), ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class BuildManifest:
+    # output_hash:        sha256 of the output file as the builder wrote it
+    # sources:            source_hashes() of the workbook it was built from
+    # dependencies:       plan_dependencies() of the plan
+    # placeholder_values: token -> text written for it, reused for tokens whose
+    #                     sheet did not change when a paragraph is rewritten
+    # builder_version:    BUILDER_VERSION of the builder that wrote the output
+    def __init__(self, excel_path, template_hash, plan_signature, output_hash, sources, dependencies,
+                 placeholder_values, builder_version=BUILDER_VERSION):
+        self.excel_path = excel_path
+        self.template_hash = template_hash
+        self.plan_signature = plan_signature
+        self.output_hash = output_hash
+        self.sources = sources
+        self.dependencies = dependencies
+        self.placeholder_values = placeholder_values
+        self.builder_version = builder_version
+
+    def changed_sheets(self, template_hash, signature, sources, output_path):
+        # Sheets whose data changed since this build, or None when only a full
+        # rebuild is safe (other builder version, template or plan, shared parts
+        # changed, output missing or edited since it was written)
+        if self.builder_version != BUILDER_VERSION:
+            return None
+        if template_hash != self.template_hash or signature != self.plan_signature:
+            return None
+        if sources['shared'] != self.sources.get('shared'):
+            return None
+        if not os.path.exists(output_path) or file_sha256(output_path) != self.output_hash:
+            return None
+        previous = self.sources.get('sheets', {})
+        return {
+            sheet for sheet, digest in sources['sheets'].items()
+            if digest is None or digest != previous.get(sheet)
+        }
+
+    def affected(self, sheets):
+        # (table keys, placeholder tokens) fed by the given sheets
+        tables, tokens = [], set()
+        for sheet in sheets:
+            entry = self.dependencies.get(sheet, {})
+            tables.extend(entry.get('tables', []))
+            tokens.update(entry.get('placeholders', []))
+        return tables, tokens
+
+    def to_dict(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'excel_path': self.excel_path,
+            'template_hash': self.template_hash,
+            'plan_signature': self.plan_signature,
+            'output_hash': self.output_hash,
+            'sources': self.sources,
+            'dependencies': self.dependencies,
+            'placeholder_values': self.placeholder_values,
+            'builder_version': self.builder_version,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported build manifest version: {d.get('version')}")
+        return cls(d['excel_path'], d['template_hash'], d['plan_signature'], d['output_hash'], d['sources'],
+                   d['dependencies'], d['placeholder_values'], d.get('builder_version'))
+
+
+def manifest_path(output_path, cache_dir=CACHE_DIR):
+    key = hashlib.sha256(os.path.abspath(output_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'builds', f'{key}.json')
+
+
+def load_manifest(output_path, cache_dir=CACHE_DIR):
+    path = manifest_path(output_path, cache_dir)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return BuildManifest.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None  # no previous build, or an entry this version cannot use
+
+
+def save_manifest(output_path, manifest, cache_dir=CACHE_DIR):
+    path = manifest_path(output_path, cache_dir)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # without a manifest the next build is simply a full one
+
+
+def discard_manifest(output_path, cache_dir=CACHE_DIR):
+    try:
+        os.remove(manifest_path(output_path, cache_dir))
+    except OSError:
+        pass
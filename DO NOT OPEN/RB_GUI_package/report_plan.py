@@ -0,0 +1,279 @@
+# Declarative report layout for report_builder. report_mapping.json describes
+# how each sheet is extracted, which columns land in which Word table, and
+# which cell feeds each placeholder; compile_plan() turns it into an execution
+# plan that reads every sheet once, visits every table once and leaves out
+# sheets, hooks and constants nothing consumes.
+#
+# Dry run (prints the plan without building anything):
+#   python report_plan.py --template template.docx [--mapping report_mapping.json] [--json]
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+MAPPING_VERSION = 2
+MAPPING_FILE_NAME = 'report_mapping.json'
+SHEET_READERS = ('rows', 'emission_factors')
+
+
+def _default_mapping_path():
+    # Next to this module, or in the PyInstaller bundle
+    base_dir = getattr(sys, '_MEIPASS', None) or os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, MAPPING_FILE_NAME)
+
+
+DEFAULT_MAPPING_PATH = _default_mapping_path()
+
+
+def load_mapping(mapping_path=DEFAULT_MAPPING_PATH):
+    with open(mapping_path, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    if mapping.get('version') != MAPPING_VERSION:
+        raise ValueError(f"Unsupported mapping version in {mapping_path}: {mapping.get('version')}")
+    for sheet_name, spec in mapping.get('sheets', {}).items():
+        reader = spec.get('reader', 'rows')
+        if reader not in SHEET_READERS:
+            raise ValueError(f"Sheet '{sheet_name}': unknown reader '{reader}'")
+        if reader == 'rows' and not spec.get('columns'):
+            raise ValueError(f"Sheet '{sheet_name}': a rows reader needs at least one column")
+    for table in mapping.get('tables', []):
+        if table.get('sheet') not in mapping.get('sheets', {}):
+            raise ValueError(f"Table '{table.get('table')}': sheet '{table.get('sheet')}' is not described under 'sheets'")
+    return mapping
+
+
+def extract_spec(sheet_spec):
+    # Mapping entry -> spec for report_builder.extract_sheet (post stays a hook name)
+    spec = {
+        'start_row': sheet_spec['start_row'],
+        'columns': list(sheet_spec['columns']),
+        'stop_columns': list(sheet_spec.get('stop_columns', sheet_spec['columns'])),
+        'empty_streak': sheet_spec.get('empty_streak', 2),
+    }
+    if sheet_spec.get('post'):
+        spec['post'] = sheet_spec['post']
+    if sheet_spec.get('constants'):
+        spec['constants'] = dict(sheet_spec['constants'])
+    return spec
+
+
+class TablePlan:
+    def __init__(self, table, sheet, start_row, cell_mapping, group_merge=None, empty_check=False, index=None):
+        self.table = table  # stable ID (caption without its number), full caption or position
+        self.index = index  # position in the template, when planned against one
+        self.sheet = sheet
+        self.start_row = start_row
+        self.cell_mapping = cell_mapping  # data key -> (row offset, column), as fill_table takes it
+        self.group_merge = group_merge
+        self.empty_check = empty_check
+
+
+class SheetPlan:
+    def __init__(self, name, reader, spec, tables):
+        self.name = name
+        self.reader = reader
+        self.spec = spec  # extract_sheet spec for 'rows', {'header': n} for 'emission_factors'
+        self.tables = tables
+
+
+class ReportPlan:
+    # sheets:       SheetPlan per sheet that feeds at least one table, in mapping order
+    # placeholders: {sheet: [(token, cell), ...]} for the template's placeholders
+    # skipped:      human-readable notes on what the planner left out
+    def __init__(self, mapping_path, sheets, placeholders, skipped):
+        self.mapping_path = mapping_path
+        self.sheets = sheets
+        self.placeholders = placeholders
+        self.skipped = skipped
+
+    @property
+    def tables(self):
+        return [table for sheet in self.sheets for table in sheet.tables]
+
+    @property
+    def empty_check_tables(self):
+        return [table.table for table in self.tables if table.empty_check]
+
+    def to_dict(self):
+        return {
+            'mapping_path': self.mapping_path,
+            'sheets': [{
+                'name': sheet.name,
+                'reader': sheet.reader,
+                'spec': sheet.spec,
+                'tables': [{
+                    'table': table.table,
+                    'index': table.index,
+                    'start_row': table.start_row,
+                    'columns': {key: col for key, (_, col) in table.cell_mapping.items()},
+                    'group_merge': table.group_merge,
+                    'empty_check': table.empty_check,
+                } for table in sheet.tables],
+            } for sheet in self.sheets],
+            'placeholders': {sheet: [list(item) for item in items] for sheet, items in self.placeholders.items()},
+            'empty_check_tables': self.empty_check_tables,
+            'skipped': self.skipped,
+        }
+
+    def describe(self):
+        lines = [f"Mapping: {self.mapping_path}", "Sheets (each read once):"]
+        for sheet in self.sheets:
+            if sheet.reader == 'rows':
+                extra = ''.join(
+                    f", {name} {sheet.spec[name]}" for name in ('post', 'constants') if name in sheet.spec
+                )
+                how = f"rows from {sheet.spec['start_row']}, columns {','.join(sheet.spec['columns'])}{extra}"
+            else:
+                how = f"{sheet.reader}, header row {sheet.spec['header']}"
+            lines.append(f"  {sheet.name}: {how}")
+            for table in sheet.tables:
+                columns = ', '.join(f"{key}->{col}" for key, (_, col) in table.cell_mapping.items())
+                flags = ''.join([
+                    f" [merge {table.group_merge['columns']} by {table.group_merge['key']}]" if table.group_merge else '',
+                    ' [empty check]' if table.empty_check else '',
+                ])
+                position = f" (#{table.index})" if table.index is not None else ''
+                lines.append(f"    table {table.table}{position} from row {table.start_row}: {columns}{flags}")
+        lines.append("Placeholders (cell reads):")
+        if not self.placeholders:
+            lines.append("  none")
+        for sheet, items in self.placeholders.items():
+            lines.append(f"  {sheet}: {len(items)} cells ({', '.join(cell for _, cell in items)})")
+        if self.skipped:
+            lines.append("Skipped:")
+            lines.extend(f"  {note}" for note in self.skipped)
+        return '\n'.join(lines)
+
+
+def _resolve_placeholders(rules, template):
+    # Every template token must be mapped, by its own entry under 'cells' or by
+    # the sheet of its TableN prefix under 'prefixes'
+    if template is None:
+        return {}
+    cells = rules.get('cells', {})
+    prefixes = rules.get('prefixes', {})
+    grouped = {}
+    for token in template.placeholders:
+        if token in cells:
+            sheet, cell = cells[token]
+        else:
+            prefix, _, cell = token.partition('_')
+            sheet = prefixes.get(prefix) if not token.startswith('rb_') else None
+            if sheet is None:
+                raise ValueError(f"Placeholder '{token}' is not mapped: add it to 'cells' or its prefix to "
+                                 f"'prefixes' under 'placeholders' in the mapping file")
+        grouped.setdefault(sheet, []).append((token, cell))
+    return grouped
+
+
+def compile_plan(mapping, template=None, mapping_path=None):
+    # template: CompiledTemplate whose tables and placeholders are planned against
+    # (None: tables stay unresolved and there is no placeholder stage)
+    tables_by_sheet = {}
+    for table in mapping.get('tables', []):
+        # Raises KeyError/IndexError early for a table the template does not have
+        index = template.registry.index(table['table']) if template is not None else None
+        tables_by_sheet.setdefault(table['sheet'], []).append(TablePlan(
+            table['table'],
+            table['sheet'],
+            table.get('start_row', 0),
+            {key: (0, col) for key, col in table['columns'].items()},
+            table.get('group_merge'),
+            table.get('empty_check', False),
+            index,
+        ))
+
+    sheets, skipped = [], []
+    for sheet_name, sheet_spec in mapping.get('sheets', {}).items():
+        tables = tables_by_sheet.get(sheet_name)
+        if not tables:
+            skipped.append(f"sheet {sheet_name}: no table reads it")
+            continue
+        reader = sheet_spec.get('reader', 'rows')
+        if reader != 'rows':
+            sheets.append(SheetPlan(sheet_name, reader, {'header': sheet_spec.get('header', 0)}, tables))
+            continue
+
+        spec = extract_spec(sheet_spec)
+        consumed = {key for table in tables for key in table.cell_mapping}
+        for key in list(spec.get('constants', {})):
+            if key not in consumed:
+                del spec['constants'][key]
+                skipped.append(f"sheet {sheet_name}: constant '{key}' is not used")
+        if not spec.get('constants'):
+            spec.pop('constants', None)
+        # A post hook only matters when some table reads a key the sheet does not
+        # produce by itself
+        derived = consumed - set(spec['columns']) - set(spec.get('constants', {}))
+        if spec.get('post') and not derived:
+            skipped.append(f"sheet {sheet_name}: post hook '{spec.pop('post')}' has no consumers")
+        if not spec.get('post'):
+            # Without a hook only the columns tables read are collected; stop
+            # columns still decide where the data ends
+            unused = [col for col in spec['columns'] if col not in consumed]
+            if unused and len(unused) < len(spec['columns']):
+                spec['columns'] = [col for col in spec['columns'] if col in consumed]
+                skipped.append(f"sheet {sheet_name}: columns {','.join(unused)} are not used")
+        sheets.append(SheetPlan(sheet_name, reader, spec, tables))
+
+    placeholders = _resolve_placeholders(mapping.get('placeholders', {}), template)
+    if template is not None and not placeholders:
+        skipped.append("placeholders: template has none")
+    return ReportPlan(mapping_path, sheets, placeholders, skipped)
+
+
+class PlanCache:
+    # Compiled plans keyed by mapping file and template; a mapping entry is
+    # recompiled when the file's mtime or size changes
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, mapping_path=DEFAULT_MAPPING_PATH, template=None):
+        path = os.path.abspath(mapping_path)
+        st = os.stat(path)
+        key = (path, template.template_hash if template is not None else None)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+        plan = compile_plan(load_mapping(path), template, mapping_path=path)
+        with self._lock:
+            self._entries[key] = (stamp, plan)
+            while len(self._entries) > self.maxsize:
+                self._entries.pop(next(iter(self._entries)))
+        return plan
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+PLAN_CACHE = PlanCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the report build plan for a mapping file (dry run).")
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING_PATH, help="Layout mapping (.json)")
+    parser.add_argument('--template', default=None, help="Word template, to plan its placeholders too")
+    parser.add_argument('--json', action='store_true', help="Print the plan as JSON")
+    args = parser.parse_args(argv)
+
+    template = None
+    if args.template:
+        from report_template import compile_template
+        template = compile_template(args.template)
+    plan = PLAN_CACHE.get(args.mapping, template)
+    if args.json:
+        print(json.dumps(plan.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        print(plan.describe())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
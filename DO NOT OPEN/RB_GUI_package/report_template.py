@@ -0,0 +1,338 @@
+# Compiled Word template index and in-process template cache for report_builder.
+# A template is scanned once for every placeholder token and every body table;
+# the result is cached on disk keyed by the template's SHA-256, so later runs
+# jump straight to the paragraphs and tables they rewrite. The parsed package is
+# also kept in memory so each build only clones the XML parts it may change.
+# Body tables are registered under their "表格 N..." captions, so callers can
+# address a table by what it is rather than by its position.
+
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from docx import Document
+from docx.oxml.ns import qn
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.part import XmlPart
+from docx.package import Package
+from docx.text.paragraph import Paragraph
+
+TEMPLATE_INDEX_VERSION = 3
+CACHE_DIR = os.environ.get("GHG_REPORT_BUILDER_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".ghg_report_builder_cache"
+)
+
+# Table6.1_J4, Table8_A23, rb_company_name, ...; which cell feeds each one is
+# described in report_mapping.json (see report_plan)
+PLACEHOLDER_PATTERN = re.compile(r'(Table\d+(?:\.\d+)?)_([A-Z]{1,3}[1-9]\d*)|rb_[a-z_]+')
+
+# Table captions: "表格 27溫室氣體排放係數資訊彙整表". The number is a Word SEQ field
+# and shifts whenever a table is inserted, so the stable ID is the rest.
+TABLE_CAPTION_PREFIX = '表格 '
+TABLE_CAPTION_NUMBER = re.compile(r'^表格\s*\d+\s*')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_story_parts(doc):
+    # Main document plus every header/footer part, each listed once
+    yield doc.part
+    seen = set()
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.reltype not in (RT.HEADER, RT.FOOTER):
+            continue
+        if rel.target_part.partname not in seen:
+            seen.add(rel.target_part.partname)
+            yield rel.target_part
+
+
+def element_path(root, element):
+    # Child-index path from root down to element, e.g. [0, 57, 3, 1, 0]
+    path = []
+    while element is not root:
+        parent = element.getparent()
+        path.append(parent.index(element))
+        element = parent
+    return path[::-1]
+
+
+def resolve_path(root, path):
+    element = root
+    for idx in path:
+        element = element[idx]
+    return element
+
+
+def table_id(caption):
+    # '表格 27溫室氣體排放係數資訊彙整表' -> '溫室氣體排放係數資訊彙整表'
+    if not caption:
+        return None
+    return TABLE_CAPTION_NUMBER.sub('', caption).strip() or None
+
+
+def scan_tables(document):
+    # Every body-level w:tbl with the "表格 " caption paragraph preceding it
+    tables = []
+    seen_ids = {}
+    caption = None
+    for block in document.body.iterchildren(qn('w:p'), qn('w:tbl')):
+        if block.tag == qn('w:p'):
+            text = Paragraph(block, None).text.strip()
+            if text.startswith(TABLE_CAPTION_PREFIX):
+                caption = text
+            continue
+        stable_id = table_id(caption)
+        if stable_id is not None:
+            seen_ids[stable_id] = seen_ids.get(stable_id, 0) + 1
+            if seen_ids[stable_id] > 1:
+                stable_id = f"{stable_id} ({seen_ids[stable_id]})"  # repeated title
+        grid = block.tblGrid
+        tables.append({
+            'index': len(tables),
+            'path': element_path(document, block),
+            'rows': len(block.tr_lst),
+            'columns': len(grid.gridCol_lst) if grid is not None else 0,
+            'caption': caption,
+            'id': stable_id,
+        })
+        caption = None  # a caption names only the table right after it
+    return tables
+
+
+class TableRegistry:
+    # O(1) lookup of a body table's position by stable ID, full caption or index
+    def __init__(self, tables):
+        self.tables = tables
+        self._positions = {}
+        for table in tables:
+            for key in (table.get('id'), table.get('caption')):
+                if key:
+                    self._positions.setdefault(key, table['index'])
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __contains__(self, key):
+        try:
+            self.index(key)
+        except (IndexError, KeyError):
+            return False
+        return True
+
+    def index(self, key):
+        if isinstance(key, int):
+            if not 0 <= key < len(self.tables):
+                raise IndexError(f"Template has only {len(self.tables)} tables; requested index {key}")
+            return key
+        position = self._positions.get(key)
+        if position is None:
+            raise KeyError(f"No table captioned '{key}' in the template")
+        return position
+
+    def get(self, key):
+        return self.tables[self.index(key)]
+
+
+class CompiledTemplate:
+    # placeholders: tokens in order of first appearance in the template
+    # locations:    [{'part': partname, 'path': [...], 'tokens': [...]}] per w:p holding tokens
+    # tables:       [{'index': i, 'path': [...], 'rows': n, 'columns': m,
+    #                 'caption': '表格 ...' or None, 'id': stable ID or None}] per body-level w:tbl
+    def __init__(self, template_hash, placeholders, locations, tables):
+        self.template_hash = template_hash
+        self.placeholders = placeholders
+        self.locations = locations
+        self.tables = tables
+        self.registry = TableRegistry(tables)
+
+    @property
+    def tokens(self):
+        return set(self.placeholders)
+
+    def to_dict(self):
+        return {
+            'version': TEMPLATE_INDEX_VERSION,
+            'template_hash': self.template_hash,
+            'placeholders': self.placeholders,
+            'locations': self.locations,
+            'tables': self.tables,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get('version') != TEMPLATE_INDEX_VERSION:
+            raise ValueError(f"Unsupported template index version: {d.get('version')}")
+        return cls(d['template_hash'], d['placeholders'], d['locations'], d['tables'])
+
+
+def scan_template(doc, template_hash=None):
+    placeholders = []
+    locations = []
+    for part in iter_story_parts(doc):
+        root = part.element
+        for p in root.iter(qn('w:p')):
+            text = Paragraph(p, part).text
+            if not text:
+                continue
+            tokens = []
+            for match in PLACEHOLDER_PATTERN.finditer(text):
+                token = match.group(0)
+                if token not in placeholders:
+                    placeholders.append(token)
+                if token not in tokens:
+                    tokens.append(token)
+            if tokens:
+                locations.append({
+                    'part': str(part.partname),
+                    'path': element_path(root, p),
+                    'tokens': tokens,
+                })
+
+    return CompiledTemplate(template_hash, placeholders, locations, scan_tables(doc.element))
+
+
+def _index_cache_path(cache_dir, template_hash):
+    return os.path.join(cache_dir, 'templates', f'{template_hash}.json')
+
+
+def compile_template(word_path, doc=None, cache_dir=CACHE_DIR, template_hash=None):
+    # doc: an unmodified Document already opened from word_path, reused on a cache miss
+    if template_hash is None:
+        template_hash = file_sha256(word_path)
+    cache_path = _index_cache_path(cache_dir, template_hash) if cache_dir else None
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return CompiledTemplate.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # stale or corrupt entry; recompile below
+
+    compiled = scan_template(doc if doc is not None else Document(word_path), template_hash)
+
+    if cache_path:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(compiled.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # the cache is an optimization only
+    return compiled
+
+
+# ===== In-process template cache =====
+def clone_package(package):
+    # New Package whose XML parts are deep copies of the cached tree (no zip
+    # extraction or parsing); binary parts without relationships, such as
+    # images and fonts, are immutable here and shared by reference.
+    clone = Package()
+    parts = {}
+    for part in package.iter_parts():
+        if isinstance(part, XmlPart):
+            parts[part] = type(part)(part.partname, part.content_type, copy.deepcopy(part.element), clone)
+        elif len(part.rels):
+            parts[part] = type(part).load(part.partname, part.content_type, part.blob, clone)
+        else:
+            parts[part] = part
+    for source, target in parts.items():
+        if target is source:
+            continue
+        for rel in source.rels.values():
+            related = rel.target_ref if rel.is_external else parts[rel.target_part]
+            target.load_rel(rel.reltype, related, rel.rId, rel.is_external)
+    for rel in package.rels.values():
+        related = rel.target_ref if rel.is_external else parts[rel.target_part]
+        clone.load_rel(rel.reltype, related, rel.rId, rel.is_external)
+    clone.after_unmarshal()
+    return clone
+
+
+class _CachedTemplate:
+    def __init__(self, stamp, template_hash, package, compiled):
+        self.stamp = stamp  # (mtime_ns, size) of the file when last validated
+        self.template_hash = template_hash
+        self.package = package  # pristine; never handed out or modified
+        self.compiled = compiled
+
+
+class TemplateCache:
+    # Parsed templates keyed by absolute path, bounded LRU. An entry is
+    # revalidated on every open(): a changed mtime/size triggers a re-hash, and
+    # a changed hash reloads the template.
+    def __init__(self, maxsize=4, cache_dir=CACHE_DIR):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, word_path):
+        # -> (Document clone for one build, CompiledTemplate)
+        with self._lock:
+            entry = self._entry(os.path.abspath(word_path))
+            package = clone_package(entry.package)
+        return package.main_document_part.document, entry.compiled
+
+    def compiled(self, word_path):
+        # CompiledTemplate alone, without cloning the document
+        with self._lock:
+            return self._entry(os.path.abspath(word_path)).compiled
+
+    def _entry(self, key):
+        entry = self._validated_entry(key)
+        if entry is None:
+            self.misses += 1
+            entry = self._load(key)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def invalidate(self, word_path=None):
+        with self._lock:
+            if word_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(word_path), None)
+
+    def _validated_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        st = os.stat(key)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == entry.stamp:
+            return entry
+        if file_sha256(key) == entry.template_hash:
+            entry.stamp = stamp  # touched but unchanged
+            return entry
+        del self._entries[key]
+        return None
+
+    def _load(self, key):
+        st = os.stat(key)
+        with open(key, 'rb') as f:
+            blob = f.read()
+        template_hash = hashlib.sha256(blob).hexdigest()
+        doc = Document(BytesIO(blob))
+        compiled = compile_template(key, doc, cache_dir=self.cache_dir, template_hash=template_hash)
+        return _CachedTemplate((st.st_mtime_ns, st.st_size), template_hash, doc.part.package, compiled)
+
+
+TEMPLATE_CACHE = TemplateCache()
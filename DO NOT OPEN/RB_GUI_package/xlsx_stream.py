@@ -0,0 +1,280 @@
+# Streaming .xlsx reader, the low-level alternative to openpyxl's read-only
+# mode behind WorkbookSnapshot (backend 'lxml'). Each pass streams one
+# xl/worksheets/sheetN.xml part straight out of the zip with lxml iterparse,
+# builds cells only for the projected columns and clears every row once it has
+# been read, so CPU and memory follow the columns a reader asks for rather than
+# the width of the sheet. Shared strings are parsed on demand, only as far as
+# the highest index a cell refers to.
+#
+# Cells carry the same value, data_type and number_format openpyxl's read-only,
+# data-only cells do (dates converted through the workbook epoch, errors as
+# '#N/A'-style strings, formulas as their cached values), and rows follow the
+# same rules as SheetSnapshot: missing rows come back empty and the sheet ends
+# at its last <row>.
+
+import threading
+
+from lxml import etree
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+from report_manifest import workbook_part, workbook_sheet_parts
+
+SHARED_STRINGS_PART = 'xl/sharedStrings.xml'
+STYLES_PART = 'xl/styles.xml'
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_ROW = _NS + 'row'
+_VALUE = _NS + 'v'
+_INLINE_STRING = _NS + 'is'
+_TEXT = _NS + 't'
+_RUN = _NS + 'r'
+_STRING_ITEM = _NS + 'si'
+
+# (number_format, is a date format, is a duration format) of unstyled cells
+_GENERAL_STYLE = ('General', False, False)
+
+_column_indices = {}
+
+
+def _split_reference(reference):
+    # 'AB12' -> (12, 28)
+    letters = reference.rstrip('0123456789')
+    column = _column_indices.get(letters)
+    if column is None:
+        column = _column_indices[letters] = column_index_from_string(letters)
+    return int(reference[len(letters):]), column
+
+
+def _text_content(node):
+    # Plain text of an <si> or <is> element: its own <t> plus the <t> of every
+    # rich text run; phonetic runs (<rPh>) are not part of the value
+    parts = []
+    text = node.findtext(_TEXT)
+    if text:
+        parts.append(text)
+    for run in node.iterfind(_RUN):
+        text = run.findtext(_TEXT)
+        if text:
+            parts.append(text)
+    return ''.join(parts)
+
+
+def _cast_number(text):
+    if '.' in text or 'E' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+
+class StreamCell:
+    __slots__ = ('value', 'data_type', 'number_format')
+
+    def __init__(self, value, data_type, number_format):
+        self.value = value
+        self.data_type = data_type
+        self.number_format = number_format
+
+    def __repr__(self):
+        return f"<StreamCell {self.value!r}>"
+
+
+class StreamingWorkbook:
+    # Works on an open ZipFile owned by the caller
+    def __init__(self, zf, sheet_parts=None):
+        self._zip = zf
+        self.sheet_parts = sheet_parts if sheet_parts is not None else workbook_sheet_parts(zf)
+        self.sheetnames = list(self.sheet_parts)
+        self._sheets = {}
+        self._epoch = None
+        self._styles = None
+        self._strings = []
+        self._string_source = None
+        self._string_items = None
+        self._strings_lock = threading.Lock()
+
+    @property
+    def epoch(self):
+        if self._epoch is None:
+            root = etree.fromstring(self._zip.read(workbook_part(self._zip)))
+            properties = root.find(_NS + 'workbookPr')
+            date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+            self._epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        return self._epoch
+
+    @property
+    def styles(self):
+        # Cell style index (the s attribute) -> (number_format, is_date, is_timedelta),
+        # resolved the way openpyxl's stylesheet does
+        if self._styles is None:
+            try:
+                root = etree.fromstring(self._zip.read(STYLES_PART))
+            except KeyError:
+                self._styles = []
+                return self._styles
+            custom = {
+                int(fmt.get('numFmtId')): fmt.get('formatCode')
+                for fmt in root.iterfind(f'{_NS}numFmts/{_NS}numFmt')
+            }
+            styles = []
+            for xf in root.iterfind(f'{_NS}cellXfs/{_NS}xf'):
+                fmt_id = int(xf.get('numFmtId', 0))
+                fmt = custom.get(fmt_id)
+                if fmt is None:
+                    fmt = BUILTIN_FORMATS.get(fmt_id, 'General')
+                styles.append((fmt, is_date_format(fmt), is_timedelta_format(fmt)))
+            self._styles = styles
+        return self._styles
+
+    def shared_string(self, index):
+        strings = self._strings
+        if index < len(strings):
+            return strings[index]
+        with self._strings_lock:
+            while index >= len(strings):
+                if self._string_items is None:
+                    self._string_source = self._zip.open(SHARED_STRINGS_PART)
+                    self._string_items = etree.iterparse(self._string_source, events=('end',), tag=_STRING_ITEM)
+                item = next(self._string_items, None)
+                if item is None:
+                    raise IndexError(f"Shared string {index} not found")
+                _, node = item
+                strings.append(_text_content(node).replace('x005F_', ''))
+                node.clear()
+                while node.getprevious() is not None:
+                    del node.getparent()[0]
+        return strings[index]
+
+    def close(self):
+        if self._string_source is not None:
+            self._string_source.close()
+            self._string_source = None
+            self._string_items = None
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self.sheet_parts
+
+    def __getitem__(self, sheet_name):
+        sheet = self._sheets.get(sheet_name)
+        if sheet is None:
+            if sheet_name not in self.sheet_parts:
+                raise ValueError(f"Sheet '{sheet_name}' not found. Available: {self.sheetnames}")
+            sheet = self._sheets[sheet_name] = StreamingSheet(self, sheet_name, self.sheet_parts[sheet_name])
+        return sheet
+
+    def read_cell(self, c):
+        # <c> element -> StreamCell, as openpyxl's WorkSheetParser.parse_cell with data_only
+        data_type = c.get('t', 'n')
+        style_id = int(c.get('s') or 0)
+        styles = self.styles
+        style = styles[style_id] if style_id < len(styles) else _GENERAL_STYLE
+        if data_type == 'inlineStr':
+            value = None
+            child = c.find(_INLINE_STRING)
+            if child is not None:
+                data_type = 's'
+                value = _text_content(child)
+            return StreamCell(value, data_type, style[0])
+        value = c.findtext(_VALUE) or None
+        if value is not None:
+            if data_type == 'n':
+                value = _cast_number(value)
+                if style[1]:
+                    data_type = 'd'
+                    try:
+                        value = from_excel(value, self.epoch, timedelta=style[2])
+                    except (OverflowError, ValueError):
+                        data_type, value = 'e', '#VALUE!'
+            elif data_type == 's':
+                value = self.shared_string(int(value))
+            elif data_type == 'b':
+                value = bool(int(value))
+            elif data_type == 'str':
+                data_type = 's'
+            elif data_type == 'd':
+                value = from_ISO8601(value)
+        return StreamCell(value, data_type, style[0])
+
+
+class StreamingSheet:
+    # Same reader interface as SheetSnapshot; every call is one streaming pass
+    def __init__(self, workbook, title, part_name):
+        self.workbook = workbook
+        self.title = title
+        self.part_name = part_name
+
+    def _rows(self):
+        # (row number, <row> element) in document order; each element is cleared
+        # once the caller moves on
+        counter = 0
+        with self.workbook._zip.open(self.part_name) as src:
+            for _, row in etree.iterparse(src, events=('end',), tag=_ROW):
+                r = row.get('r')
+                counter = int(float(r)) if r else counter + 1
+                yield counter, row
+                row.clear()
+                while row.getprevious() is not None:
+                    del row.getparent()[0]
+
+    def _row_cells(self, row, wanted):
+        # {column: StreamCell} for the wanted columns (all when None) and the
+        # row's width, which openpyxl takes from its last cell
+        cells = {}
+        column = 0
+        for c in row:
+            reference = c.get('r')
+            column = _split_reference(reference)[1] if reference else column + 1
+            if wanted is None or column in wanted:
+                cells[column] = self.workbook.read_cell(c)
+        return cells, column
+
+    def iter_rows(self, min_row=1, max_row=None, columns=None, values_only=False):
+        # columns: optional 1-based column indices to project each row onto
+        wanted = set(columns) if columns is not None else None
+        empty = (EMPTY_CELL,) * len(columns) if columns is not None else ()
+        if values_only:
+            empty = (None,) * len(empty)
+        counter = min_row
+        for idx, row in self._rows():
+            if max_row is not None and idx > max_row:
+                break
+            if idx < counter:
+                continue  # before min_row, or out of order
+            for _ in range(counter, idx):
+                yield empty
+            counter = idx + 1
+            cells, width = self._row_cells(row, wanted)
+            if columns is not None:
+                cells = tuple(cells.get(c, EMPTY_CELL) if c <= width else EMPTY_CELL for c in columns)
+            else:
+                cells = tuple(cells.get(c, EMPTY_CELL) for c in range(1, width + 1))
+            if values_only:
+                cells = tuple(cell.value for cell in cells)
+            yield cells
+
+    def cells(self, coordinates):
+        # {coordinate: cell} for many addresses in a single pass
+        targets = {coordinate: coordinate_to_tuple(coordinate) for coordinate in coordinates}
+        if not targets:
+            return {}
+        wanted = {}
+        for row, column in targets.values():
+            wanted.setdefault(row, set()).add(column)
+        columns = sorted({column for _, column in targets.values()})
+        found = {}
+        for row_number, cells in enumerate(
+                self.iter_rows(min(wanted), max(wanted), columns=columns), start=min(wanted)):
+            if row_number in wanted:
+                for column, cell in zip(columns, cells):
+                    found[row_number, column] = cell
+        return {coordinate: found.get(position, EMPTY_CELL) for coordinate, position in targets.items()}
+
+    def cell(self, row, column):
+        for cells in self.iter_rows(row, row, columns=[column]):
+            return cells[0]
+        return EMPTY_CELL
+
+    def __getitem__(self, coordinate):
+        row, column = coordinate_to_tuple(coordinate)
+        return self.cell(row, column)
@@ -1,211 +1,557 @@
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import re
+import zipfile
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.utils import column_index_from_string
+from lxml import etree
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string, range_boundaries
 
 def col(letter):
     return column_index_from_string(letter) - 1
 
-def classify_calculation_method(file_path):
-    sheet_name = '表3.活動數據'
-
-    # 1. Read from row 4 (skip first 3 rows)
-    df = pd.read_excel(file_path, sheet_name=sheet_name, skiprows=3, engine='openpyxl')
-
-    # 2. Column mappings using Excel letters
-    col_source = col('C')     # 排放源
-    col_category = col('F')   # 排放類別
-    col_unit = col('O')       # 單位
-    col_type = col('A')       # 類別 or type1 in SQLite db
-    col_activity = col('B')  # 活動/設備/type2 in SQLite db
-
-    # 3. Define flexible rule set
-    rules = [
-        #SCOPE 1 - DIRECT EMISSIONS - 範疇1
-        #STATIONARY COMBUSTION - 固定源
-        {
-            'match': lambda row: row[col_unit] in ['公秉', '千公秉','千立方公尺', '立方公尺', '公斤','公升', '公噸'] 
-                        and row[col_category] in ['固定源'],
-            'formula': lambda row: f"{row[col_source]}使用量×排放係數×GWP值"
-        },
-        #MOBILE COMBUSTION - 移動源
-        {
-            'match': lambda row: row[col_unit] in ['公秉', '千公秉','千立方公尺', '立方公尺', '公斤','公升'，'公噸'] 
-                        and row[col_category] in ['移動源'],
-            'formula': lambda row: f"{row[col_source]}使用量×排放係數×GWP值"
-        },
-        #FUGITIVE EMISSIONS - 逸散排放
-        #Refrigerants 冷媒
-        {
-            'match': lambda row: 'R' in str(row[col_source])
-                    and row[col_category] in ['逸散排放'],
-            'formula': lambda row: f"冷媒設備填充量/規格量×設備逸散因子×排放係數×GWP值\n設備逸散因子來源參考2006 IPCC Guidelines for National Greenhouse Gas Inventories, volume 3, chapter7, table 7.9，採用中間值作為逸散因子"
-        },
-        #Septic Tank 化糞池
-        {
-            'match': lambda row: row[col_type] in ['化糞池']
-                    and row[col_category] in ['逸散排放'],
-            'formula': lambda row: "員工數×對應工作天數與時數之排放係數×GWP值"
-        },
-        #Fire Extinguisher 滅火器
-        {
-            'match': lambda row: row[col_category] in ['逸散排放']
-                        and row[col_type] in ['消防設施']
-                        and '滅火' in str(row[col_activity]),
-            'formula': lambda row: "填充使用重量×排放係數×GWP值"
-        },
-        #Other CO2
-        {
-            'match': lambda row: 'CO2' in str(row[col_source]) 
-                        and row[col_category] in ['逸散排放']
-                        and row[col_type] in ['其他設施']
-                        and row[col_activity] in ['其他設施'],
-            'formula': lambda row: "質量平衡法"
-        },
-
-        #SCOPE 2 - INDIRECT EMISSIONS - 範疇2
-        #Purchased Electricity 外購電力
-        {
-            'match': lambda row: row[col_category] in ['外購電力'],
-            'formula': lambda row: f"電力使用度數×排放係數×GWP值\n(外購電力排放係數採用能源局公告之112年電力排碳係數0.494公斤CO₂e/度計算)"
-        },
-        #Purchased Steam 外購蒸汽 ASKAMY about the formula or see SDC
-        {
-            'match': lambda row: '外購蒸汽' in str(row[col_source])
-                        or row[col_activity] in ['外購蒸汽'],
-            'formula': lambda row: "使用量×排放係數×GWP值"
-        },
-        #Self-Sustained Electricity 自發自用 ASKAMY about the formula or see SDC
-        {
-            'match': lambda row: '自發自用' in str(row[col_source])
-                        or row[col_activity] in ['自發自用']
-                        or row[col_category] in ['自發自用'],
-            'formula': lambda row: "使用量×排放係數×GWP值"
-        },
-
-        #CATEGORY 1 - PURCHASED GOODS & SERVICES - 類別1 - 採購商品與服務
-        #Weight-Dependent
-        {
-            'match': lambda row: ('公噸') in str(row[col_unit])
-                        and row[col_category] in ['採購商品與服務']
-                        and '自來水' not in str(row[col_source]),
-            'formula': lambda row: "採購重量×排放係數×GWP值"
-        },
-        #Volume-Dependent
-        {
-            'match': lambda row: ('公秉' or '立方公尺') in str(row[col_unit])
-                        and row[col_category] in ['採購商品與服務']
-                        and '自來水' not in str(row[col_source]),
-            'formula': lambda row: "採購體積×排放係數×GWP值"
-        },
-        #Price-Dependent (EEIO) ASKAMY about the formula
-        {
-            'match': lambda row: ('元' or '金') in str(row[col_unit])
-                        and row[col_category] in ['採購商品與服務'],
-            'formula': lambda row: "採購金額×別幣到2022美金轉換率×排放係數×GWP值"
-        },
-        #Water Supply - 自來水 ASKAMY about the criteria
-        {
-            'match': lambda row: ('自來水') in str(row[col_source])
-                        and row[col_category] in ['採購商品與服務'],
-            'formula': lambda row: "用水量x排放係數xGWP值"
-        },
-        
-        #CATEGORY 2 - CAPITAL GOODS - 類別2 - 資本財
-        {
-            'match': lambda row: ('元' or '金') in str(row[col_unit])
-                        and row[col_category] in ['資本財'],
-            'formula': lambda row: "採購金額×別幣到2022美金轉換率×排放係數×GWP值"
-        },
-
-        #CATEGORY 3 - FUEL- & ENERGY- RELATED EMISSIONS - 類別3 - 與燃料和能源相關的活動
-        #Purchased Electricity 電力
-        {
-            'match': lambda row: row[col_unit] in ['公秉', '千公秉','千立方公尺', '立方公尺', '公斤','公升','公噸','度', '千度'] 
-                        and row[col_category] in ['與燃料和能源相關的活動']
-                        and '電力' in str(row[col_source]),
-            'formula': lambda row: "電力使用量×排放係數×GWP值"
-        },
-        #Natural Gas 天然氣
-        {
-            'match': lambda row: row[col_unit] in ['公秉', '千公秉','千立方公尺', '立方公尺', '公斤','公升','公噸','度', '千度'] 
-                        and row[col_category] in ['與燃料和能源相關的活動']
-                        and '天然氣' in str(row[col_source]),
-            'formula': lambda row: "天然氣使用量×排放係數×GWP值"
-        },
-        #Petroleum Gas 汽油
-        {
-            'match': lambda row: row[col_unit] in ['公秉', '千公秉','千立方公尺', '立方公尺', '公斤','公升','公噸','度', '千度'] 
-                        and row[col_category] in ['與燃料和能源相關的活動']
-                        and '汽油' in str(row[col_source]),
-            'formula': lambda row: "汽油使用量×排放係數×GWP值"
-        },
-        #Diesel 柴油
-        {
-            'match': lambda row: row[col_unit] in ['公秉', '千公秉','千立方公尺', '立方公尺', '公斤','公升','公噸','度', '千度'] 
-                        and row[col_category] in ['與燃料和能源相關的活動']
-                        and '柴油' in str(row[col_source]),
-            'formula': lambda row: "柴油使用量×排放係數×GWP值"
-        },
-
-        #CATEGORY 4 - UPSTREAM TRANSPORTATION & DISTRIBUTION - 類別4 - 與運輸相關活動(上游運輸及配送)
-        #LAND TRANSPORT 陸運
-        {
-            'match': lambda row: row[col_unit] in ['延噸公里'] 
-                        and row[col_category] in ['與運輸相關活動(上游運輸及配送)'],
-            'formula': lambda row: "延噸公里×排放係數×GWP值"
-        },
-        #AIR TRANSPORT 空運
-        {
-            'match': lambda row: row[col_unit] in ['公噸'] 
-                        and row[col_category] in ['與運輸相關活動(上游運輸及配送)'],
-                        and ('船運' or '海運' or '港') not in str(row[col_source]),
-            'formula': lambda row: "重量×參考CarbonCare得出兩機場排放係數×GWP值"
-        },
-        {
-            'match': lambda row: row[col_unit] in ['公噸'] 
-                        and row[col_category] in ['與運輸相關活動(上游運輸及配送)'],
-                        and ('空運' or '機場') in str(row[col_source]),
-            'formula': lambda row: "重量×參考CarbonCare得出兩機場排放係數×GWP值"
-        },
-        #SEA TRANSPORT 海運
-        {
-            'match': lambda row: row[col_unit] in ['公噸'] 
-                        and row[col_category] in ['與運輸相關活動(上游運輸及配送)'],
-                        and ('船運' or '海運' or '港') in str(row[col_source]),
-            'formula': lambda row: "重量×參考CarbonCare得出兩港排放係數×GWP值"
-        },
-        #WAREHOUSE 倉庫
-        {
-            'match': lambda row: row[col_unit] in ['千度', '度'] 
-                        and row[col_category] in ['與運輸相關活動(上游運輸及配送)'],
-                        and ('倉庫' or '倉' or '庫') in str(row[col_source]),
-            'formula': lambda row: "Please Fill In"
-        },
-        # Add more rules here as needed
+SHEET_NAME = '表3.活動數據'
+HEADER_ROW = 3  # data starts on the row below
+RESULT_HEADER = '計算方式'
+
+# Incremental mode keeps row fingerprint -> 計算方式 here, next to the report
+# builder's template cache
+CACHE_DIR = os.environ.get("GHG_REPORT_BUILDER_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".ghg_report_builder_cache"
+)
+METHOD_CACHE_PATH = os.path.join(CACHE_DIR, 'classifier', 'methods.json')
+METHOD_CACHE_MAX_ENTRIES = 200000
+
+# Column mappings using Excel letters
+RULE_COLUMNS = {
+    'type': 'A',      # 類別 or type1 in SQLite db
+    'activity': 'B',  # 活動/設備/type2 in SQLite db
+    'source': 'C',    # 排放源
+    'category': 'F',  # 排放類別
+    'unit': 'O',      # 單位
+}
+
+FUEL_UNITS = ['公秉', '千公秉', '千立方公尺', '立方公尺', '公斤', '公升', '公噸']
+ENERGY_UNITS = FUEL_UNITS + ['度', '千度']
+UPSTREAM_TRANSPORT = ['與運輸相關活動(上游運輸及配送)']
+
+# Rule set, first match wins. 'match' conditions are ANDed; 'match_any' holds
+# alternatives that are ORed. Condition keys:
+#   <field>        - value is one of the list
+#   <field>_has    - text contains any of the list
+#   <field>_lacks  - text contains none of the list
+# '{source}' in a formula is replaced by the row's 排放源.
+RULES = [
+    #SCOPE 1 - DIRECT EMISSIONS - 範疇1
+    #STATIONARY COMBUSTION - 固定源
+    {
+        'match': {'unit': FUEL_UNITS, 'category': ['固定源']},
+        'formula': "{source}使用量×排放係數×GWP值"
+    },
+    #MOBILE COMBUSTION - 移動源
+    {
+        'match': {'unit': FUEL_UNITS, 'category': ['移動源']},
+        'formula': "{source}使用量×排放係數×GWP值"
+    },
+    #FUGITIVE EMISSIONS - 逸散排放
+    #Refrigerants 冷媒
+    {
+        'match': {'source_has': ['R'], 'category': ['逸散排放']},
+        'formula': "冷媒設備填充量/規格量×設備逸散因子×排放係數×GWP值\n設備逸散因子來源參考2006 IPCC Guidelines for National Greenhouse Gas Inventories, volume 3, chapter7, table 7.9，採用中間值作為逸散因子"
+    },
+    #Septic Tank 化糞池
+    {
+        'match': {'type': ['化糞池'], 'category': ['逸散排放']},
+        'formula': "員工數×對應工作天數與時數之排放係數×GWP值"
+    },
+    #Fire Extinguisher 滅火器
+    {
+        'match': {'category': ['逸散排放'], 'type': ['消防設施'], 'activity_has': ['滅火']},
+        'formula': "填充使用重量×排放係數×GWP值"
+    },
+    #Other CO2
+    {
+        'match': {'source_has': ['CO2'], 'category': ['逸散排放'], 'type': ['其他設施'], 'activity': ['其他設施']},
+        'formula': "質量平衡法"
+    },
+
+    #SCOPE 2 - INDIRECT EMISSIONS - 範疇2
+    #Purchased Electricity 外購電力
+    {
+        'match': {'category': ['外購電力']},
+        'formula': "電力使用度數×排放係數×GWP值\n(外購電力排放係數採用能源局公告之112年電力排碳係數0.494公斤CO₂e/度計算)"
+    },
+    #Purchased Steam 外購蒸汽 ASKAMY about the formula or see SDC
+    {
+        'match_any': [{'source_has': ['外購蒸汽']}, {'activity': ['外購蒸汽']}],
+        'formula': "使用量×排放係數×GWP值"
+    },
+    #Self-Sustained Electricity 自發自用 ASKAMY about the formula or see SDC
+    {
+        'match_any': [{'source_has': ['自發自用']}, {'activity': ['自發自用']}, {'category': ['自發自用']}],
+        'formula': "使用量×排放係數×GWP值"
+    },
+
+    #CATEGORY 1 - PURCHASED GOODS & SERVICES - 類別1 - 採購商品與服務
+    #Weight-Dependent
+    {
+        'match': {'unit_has': ['公噸'], 'category': ['採購商品與服務'], 'source_lacks': ['自來水']},
+        'formula': "採購重量×排放係數×GWP值"
+    },
+    #Volume-Dependent
+    {
+        'match': {'unit_has': ['公秉', '立方公尺'], 'category': ['採購商品與服務'], 'source_lacks': ['自來水']},
+        'formula': "採購體積×排放係數×GWP值"
+    },
+    #Price-Dependent (EEIO) ASKAMY about the formula
+    {
+        'match': {'unit_has': ['元', '金'], 'category': ['採購商品與服務']},
+        'formula': "採購金額×別幣到2022美金轉換率×排放係數×GWP值"
+    },
+    #Water Supply - 自來水 ASKAMY about the criteria
+    {
+        'match': {'source_has': ['自來水'], 'category': ['採購商品與服務']},
+        'formula': "用水量x排放係數xGWP值"
+    },
+
+    #CATEGORY 2 - CAPITAL GOODS - 類別2 - 資本財
+    {
+        'match': {'unit_has': ['元', '金'], 'category': ['資本財']},
+        'formula': "採購金額×別幣到2022美金轉換率×排放係數×GWP值"
+    },
+
+    #CATEGORY 3 - FUEL- & ENERGY- RELATED EMISSIONS - 類別3 - 與燃料和能源相關的活動
+    #Purchased Electricity 電力
+    {
+        'match': {'unit': ENERGY_UNITS, 'category': ['與燃料和能源相關的活動'], 'source_has': ['電力']},
+        'formula': "電力使用量×排放係數×GWP值"
+    },
+    #Natural Gas 天然氣
+    {
+        'match': {'unit': ENERGY_UNITS, 'category': ['與燃料和能源相關的活動'], 'source_has': ['天然氣']},
+        'formula': "天然氣使用量×排放係數×GWP值"
+    },
+    #Petroleum Gas 汽油
+    {
+        'match': {'unit': ENERGY_UNITS, 'category': ['與燃料和能源相關的活動'], 'source_has': ['汽油']},
+        'formula': "汽油使用量×排放係數×GWP值"
+    },
+    #Diesel 柴油
+    {
+        'match': {'unit': ENERGY_UNITS, 'category': ['與燃料和能源相關的活動'], 'source_has': ['柴油']},
+        'formula': "柴油使用量×排放係數×GWP值"
+    },
+
+    #CATEGORY 4 - UPSTREAM TRANSPORTATION & DISTRIBUTION - 類別4 - 與運輸相關活動(上游運輸及配送)
+    #LAND TRANSPORT 陸運
+    {
+        'match': {'unit': ['延噸公里'], 'category': UPSTREAM_TRANSPORT},
+        'formula': "延噸公里×排放係數×GWP值"
+    },
+    #AIR TRANSPORT 空運
+    {
+        'match': {'unit': ['公噸'], 'category': UPSTREAM_TRANSPORT, 'source_lacks': ['船運', '海運', '港']},
+        'formula': "重量×參考CarbonCare得出兩機場排放係數×GWP值"
+    },
+    {
+        'match': {'unit': ['公噸'], 'category': UPSTREAM_TRANSPORT, 'source_has': ['空運', '機場']},
+        'formula': "重量×參考CarbonCare得出兩機場排放係數×GWP值"
+    },
+    #SEA TRANSPORT 海運
+    {
+        'match': {'unit': ['公噸'], 'category': UPSTREAM_TRANSPORT, 'source_has': ['船運', '海運', '港']},
+        'formula': "重量×參考CarbonCare得出兩港排放係數×GWP值"
+    },
+    #WAREHOUSE 倉庫
+    {
+        'match': {'unit': ['千度', '度'], 'category': UPSTREAM_TRANSPORT, 'source_has': ['倉庫', '倉', '庫']},
+        'formula': "Please Fill In"
+    },
+    # Add more rules here as needed
+]
+
+
+# ===== Rule compilation: every rule becomes one boolean mask over the sheet =====
+# Each input column is factorized once; conditions are evaluated on its distinct
+# values and broadcast back to the rows through the codes.
+class RuleColumn:
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        self.codes = codes
+        self.values = pd.Series(uniques, dtype=object)
+        self.text = self.values.map(str)  # str() of NaN is 'nan', as before
+
+
+def _condition_mask(frame, key, values):
+    field, _, op = key.partition('_')
+    column = frame[field]  # KeyError when the sheet does not reach this column
+    if not op:
+        matches = column.values.isin(values).to_numpy(dtype=bool)
+    else:
+        pattern = '|'.join(re.escape(v) for v in values)
+        matches = column.text.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        if op == 'lacks':
+            matches = ~matches
+        elif op != 'has':
+            raise ValueError(f"Unknown rule condition '{key}'")
+    return matches[column.codes]
+
+
+def _all_of(frame, n, conditions):
+    mask = np.ones(n, dtype=bool)
+    for key, values in conditions.items():
+        mask &= _condition_mask(frame, key, values)
+    return mask
+
+
+def _rule_mask(frame, n, rule):
+    mask = _all_of(frame, n, rule.get('match', {}))
+    if 'match_any' in rule:
+        any_mask = np.zeros(n, dtype=bool)
+        for conditions in rule['match_any']:
+            any_mask |= _all_of(frame, n, conditions)
+        mask &= any_mask
+    return mask
+
+
+def _rule_values(frame, rule):
+    # Formula text per row (only '{source}' varies)
+    before, found, after = rule['formula'].partition('{source}')
+    if not found:
+        return rule['formula']
+    source = frame['source']
+    return (before + source.text + after).to_numpy(dtype=object)[source.codes]
+
+
+def rule_frame(df):
+    # The rule inputs by name; columns the sheet does not have are left out
+    frame = {}
+    for field, letter in RULE_COLUMNS.items():
+        idx = col(letter)
+        if idx < df.shape[1]:
+            frame[field] = RuleColumn(df.iloc[:, idx])
+    return frame
+
+
+def classify_frame(df, rules=RULES):
+    # -> (計算方式 per row, error mask). Rules are evaluated column-wise and
+    # combined first-match-wins; a rule that cannot be evaluated marks every row
+    # still unmatched at that point as 錯誤, as the row-by-row version did.
+    frame = rule_frame(df)
+    n = len(df)
+    conditions, choices = [], []
+    error_position = None
+    for rule in rules:
+        try:
+            mask = _rule_mask(frame, n, rule)
+            values = _rule_values(frame, rule)
+        except Exception as e:
+            error_position = len(conditions)
+            conditions.append(np.ones(n, dtype=bool))
+            choices.append(f"錯誤: {e}")
+            break
+        conditions.append(mask)
+        choices.append(values)
+
+    if not conditions:
+        return pd.Series([''] * n, index=df.index, dtype=object), np.zeros(n, dtype=bool)
+    choices = [np.broadcast_to(np.asarray(c, dtype=object), (n,)) for c in choices]
+    methods = np.select(conditions, choices, default='')
+
+    errors = np.zeros(n, dtype=bool)
+    if error_position is not None:
+        matched_earlier = np.zeros(n, dtype=bool)
+        for mask in conditions[:error_position]:
+            matched_earlier |= mask
+        errors = ~matched_earlier
+    return pd.Series(methods, index=df.index, dtype=object), errors
+
+
+# ===== Incremental mode: only new or changed rows are evaluated =====
+def rules_hash(rules=RULES):
+    # Any edit to the rule set changes this and drops every cached result
+    return hashlib.sha256(json.dumps(rules, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def row_fingerprints(df):
+    # Digest of the classified inputs (A, B, C, F, O) per distinct input
+    # combination -> (fingerprints, inverse: row -> combination, first row of
+    # each combination). repr keeps 'nan', 3.0 and '3.0' apart; a column the
+    # sheet lacks is part of the key too.
+    codes, texts = [], []
+    for letter in RULE_COLUMNS.values():
+        idx = col(letter)
+        if idx < df.shape[1]:
+            column_codes, uniques = pd.factorize(df.iloc[:, idx], use_na_sentinel=False)
+            codes.append(column_codes)
+            texts.append([repr(value) for value in uniques])
+        else:
+            codes.append(np.zeros(len(df), dtype=np.intp))
+            texts.append(['<missing>'])
+    # Fold the per-column codes into one combination id per row, re-factorizing
+    # after each column so the ids stay below len(df)
+    inverse = codes[0].astype(np.int64)
+    for column_codes, column_texts in zip(codes[1:], texts[1:]):
+        inverse, _ = pd.factorize(inverse * len(column_texts) + column_codes)
+    _, first = np.unique(inverse, return_index=True)
+    fingerprints = [
+        hashlib.blake2b('\x1f'.join(texts[j][codes[j][row]] for j in range(len(codes))).encode('utf-8'),
+                        digest_size=16).hexdigest()
+        for row in first
     ]
+    return fingerprints, inverse, first
+
+
+class MethodCache:
+    # Persistent fingerprint -> 計算方式 map, valid for one rule set
+    def __init__(self, path=METHOD_CACHE_PATH, rules=RULES):
+        self.path = path
+        self.rules_hash = rules_hash(rules)
+        self.methods = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('rules_hash') == self.rules_hash:
+                self.methods = stored.get('methods', {})
+        except (OSError, ValueError):
+            pass  # no cache yet, or unreadable; start empty
+
+    def save(self):
+        # Least recently used entries go first once the cache is full
+        while len(self.methods) > METHOD_CACHE_MAX_ENTRIES:
+            self.methods.pop(next(iter(self.methods)))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'rules_hash': self.rules_hash, 'methods': self.methods}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # the cache is an optimization only
+
+
+def classify_incremental(df, cache, rules=RULES):
+    # Same result as classify_frame(df, rules), but input combinations whose
+    # fingerprint is cached are not evaluated again. Errors are never cached.
+    fingerprints, inverse, first = row_fingerprints(df)
+    known = cache.methods
+    methods = np.array([known.get(fp) for fp in fingerprints], dtype=object)
+    errors = np.zeros(len(fingerprints), dtype=bool)
+    missing = np.flatnonzero(np.equal(methods, None))
+    # A hit moves its entry to the end, so the dict stays in least recently
+    # used order for save()
+    for pos in np.flatnonzero(np.not_equal(methods, None)):
+        known[fingerprints[pos]] = known.pop(fingerprints[pos])
+    hit_rows = np.isin(inverse, missing, invert=True)
+    cache.hits += int(hit_rows.sum())
+    cache.misses += len(df) - int(hit_rows.sum())
+
+    if len(missing):
+        # One representative row per new combination
+        new_methods, new_errors = classify_frame(df.iloc[first[missing]], rules)
+        methods[missing] = new_methods.to_numpy(dtype=object)
+        errors[missing] = new_errors
+        for pos, method, error in zip(missing, new_methods, new_errors):
+            if not error:
+                known[fingerprints[pos]] = method
+    return pd.Series(methods[inverse], index=df.index, dtype=object), errors[inverse]
+
+
+# ===== Write-back: patch the one worksheet part inside the .xlsx =====
+# Only the target sheet's XML is parsed and rewritten; every other zip member
+# (other sheets, styles, shared strings, formulas) is copied through unchanged.
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+DOC_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+OFFICE_DOCUMENT_REL = DOC_REL_NS + '/officeDocument'
+
+
+def _q(tag):
+    return f'{{{MAIN_NS}}}{tag}'
+
+
+def _rels_path(part_name):
+    folder, name = posixpath.split(part_name)
+    return posixpath.join(folder, '_rels', name + '.rels')
+
+
+def _rel_target(part_name, target):
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+
+
+def sheet_part_name(zf, sheet_name):
+    # 'xl/worksheets/sheet5.xml' for the named sheet, following the package rels
+    package_rels = etree.fromstring(zf.read('_rels/.rels'))
+    workbook_part = next(
+        _rel_target('', rel.get('Target')) for rel in package_rels.iter(f'{{{PKG_REL_NS}}}Relationship')
+        if rel.get('Type') == OFFICE_DOCUMENT_REL
+    )
+    workbook = etree.fromstring(zf.read(workbook_part))
+    rel_id = None
+    for sheet in workbook.iter(_q('sheet')):
+        if sheet.get('name') == sheet_name:
+            rel_id = sheet.get(f'{{{DOC_REL_NS}}}id')
+            break
+    if rel_id is None:
+        raise ValueError(f"Sheet '{sheet_name}' not found in {zf.filename}")
+    workbook_rels = etree.fromstring(zf.read(_rels_path(workbook_part)))
+    for rel in workbook_rels.iter(f'{{{PKG_REL_NS}}}Relationship'):
+        if rel.get('Id') == rel_id:
+            return _rel_target(workbook_part, rel.get('Target'))
+    raise ValueError(f"Sheet '{sheet_name}' has no worksheet part in {zf.filename}")
+
+
+def _iter_cells_with_columns(row):
+    # (column index, <c>) pairs; cells without r follow the previous one
+    column = 0
+    for c in row.iterfind(_q('c')):
+        ref = c.get('r')
+        column = column_index_from_string(coordinate_from_string(ref)[0]) if ref else column + 1
+        yield column, c
+
+
+def _inline_string_cell(ref, text):
+    c = etree.Element(_q('c'), r=ref, t='inlineStr')
+    is_ = etree.SubElement(c, _q('is'))
+    t = etree.SubElement(is_, _q('t'))
+    t.text = text
+    t.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+    return c
+
+
+def patch_sheet_column(sheet_xml, values, column=None, header_row=HEADER_ROW, header=RESULT_HEADER):
+    # Writes header + one inline-string cell per value (rows header_row+1...)
+    # into one column of a worksheet's XML; column None appends after the last
+    # used column. Empty values leave the cell out.
+    root = etree.fromstring(sheet_xml)
+    sheet_data = root.find(_q('sheetData'))
+    rows = {}
+    row_number = 0
+    for row in sheet_data.iterfind(_q('row')):
+        row_number = int(row.get('r')) if row.get('r') else row_number + 1
+        rows[row_number] = row
+    if column is None:
+        column = max(
+            (col for row in rows.values() for col, _ in _iter_cells_with_columns(row)), default=0
+        ) + 1
+    letter = get_column_letter(column)
+
+    cells = {header_row: header}
+    for offset, value in enumerate(values, start=header_row + 1):
+        cells[offset] = value
+    last_row = max(cells)
+    for row_number in sorted(cells):
+        row = rows.get(row_number)
+        text = cells[row_number]
+        if row is None:
+            if not text:
+                continue
+            row = etree.Element(_q('row'), r=str(row_number))
+            following = next((rows[r] for r in sorted(rows) if r > row_number), None)
+            if following is not None:
+                following.addprevious(row)
+            else:
+                sheet_data.append(row)
+            rows[row_number] = row
+
+        insert_before = None
+        for col, c in _iter_cells_with_columns(row):
+            if col == column:
+                row.remove(c)  # result of an earlier run
+            elif col > column and insert_before is None:
+                insert_before = c
+        if text:
+            c = _inline_string_cell(f'{letter}{row_number}', text)
+            if insert_before is not None:
+                insert_before.addprevious(c)
+            else:
+                row.append(c)
+            spans = row.get('spans')
+            if spans and ':' in spans:
+                first, last = (int(x) for x in spans.split(':'))
+                row.set('spans', f'{min(first, column)}:{max(last, column)}')
+
+    dimension = root.find(_q('dimension'))
+    if dimension is not None:
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(dimension.get('ref'))
+        except (TypeError, ValueError):
+            min_col, min_row, max_col, max_row = 1, 1, column, last_row
+        dimension.set('ref', f'{get_column_letter(min(min_col or 1, column))}{min(min_row or 1, header_row)}:'
+                             f'{get_column_letter(max(max_col or column, column))}{max(max_row or last_row, last_row)}')
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+def write_sheet_column(file_path, sheet_name, values, column=None, output_path=None,
+                       header_row=HEADER_ROW, header=RESULT_HEADER):
+    # Patches file_path in place, or writes the patched workbook to output_path
+    # and leaves file_path untouched. The file is replaced atomically.
+    target = output_path or file_path
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(file_path) as src:
+        part = sheet_part_name(src, sheet_name)
+        patched = patch_sheet_column(src.read(part), values, column, header_row, header)
+        with zipfile.ZipFile(tmp_path, 'w') as dst:
+            for info in src.infolist():
+                # Same name, timestamp and compression for every member
+                dst.writestr(info, patched if info.filename == part else src.read(info.filename))
+    os.replace(tmp_path, target)
+    return target
+
+
+def classify_calculation_method(file_path, output_path=None, incremental=False, cache_path=METHOD_CACHE_PATH):
+    # output_path: write the classified copy there (sidecar) instead of
+    # patching file_path in place
+    # incremental: reuse cached results for unchanged rows; when nothing in the
+    # 計算方式 column would change, the workbook is not rewritten at all
+    sheet_name = SHEET_NAME
+
+    # 1. Read with the header on row 3, so data starts on row 4
+    df = pd.read_excel(file_path, sheet_name=sheet_name, skiprows=HEADER_ROW - 1, engine='openpyxl')
+
+    # A 計算方式 column from an earlier run is overwritten instead of appending another
+    headers = [str(name) for name in df.columns]
+    column = headers.index(RESULT_HEADER) + 1 if RESULT_HEADER in headers else None
 
-    # 4. Apply rules
-    def get_calculation_method(row):
-        for rule in rules:
-            try:
-                if rule['match'](row):
-                    return rule['formula'](row)
-            except Exception as e:
-                return f"錯誤: {e}"
-        return ""
+    previous = df[RESULT_HEADER].fillna('').astype(str).tolist() if column is not None else None
 
-    df['計算方式'] = df.apply(get_calculation_method, axis=1)
+    # 2. Apply rules
+    cache = None
+    if incremental:
+        cache = MethodCache(cache_path)
+        df['計算方式'], df['計算方式錯誤'] = classify_incremental(df, cache)
+        cache.save()
+        print(f"Incremental: {cache.hits} rows from cache, {cache.misses} rows classified")
+    else:
+        df['計算方式'], df['計算方式錯誤'] = classify_frame(df)
 
-    # 5. Write back to Excel
-    wb = load_workbook(file_path)
-    ws = wb[sheet_name]
+    # 3. Write back to Excel: only the 表3 sheet part is rewritten
+    if incremental and output_path is None and previous == df['計算方式'].tolist():
+        print("✅ 計算方式 column is already up to date; workbook left unchanged.")
+        return df
+    target = write_sheet_column(file_path, sheet_name, df['計算方式'].tolist(), column, output_path)
 
-    start_row = 4
-    new_col_index = ws.max_column + 1
-    ws.cell(row=3, column=new_col_index, value='計算方式')  # Header
+    print(f"✅ 計算方式 column added with Excel-style column mapping: {target}")
+    if df['計算方式錯誤'].any():
+        print(f"⚠️ {int(df['計算方式錯誤'].sum())} rows could not be classified (see 錯誤: entries).")
+    return df
 
-    for i, value in enumerate(df['計算方式'], start=start_row):
-        ws.cell(row=i, column=new_col_index, value=value)
 
-    wb.save(file_path)
-    print("✅ 計算方式 column added with Excel-style column mapping.")
+if __name__ == '__main__':
+    # python calc_method_classifier.py inventory.xlsx [classified.xlsx] [--incremental]
+    parser = argparse.ArgumentParser(description="Add the 計算方式 column to 表3.活動數據.")
+    parser.add_argument('file_path', help="Inventory workbook (.xlsx)")
+    parser.add_argument('output_path', nargs='?', default=None,
+                        help="Write the classified copy here instead of patching the inventory")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only classify rows that are new or changed since the last run")
+    args = parser.parse_args()
+    classify_calculation_method(args.file_path, args.output_path, args.incremental)
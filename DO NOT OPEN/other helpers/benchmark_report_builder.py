@@ -0,0 +1,463 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Benchmark suite for report_builder and the 計算方式 classifier on synthetic
+# inventories of any size.
+#
+# Synthetic workbooks are grown from template/excel_input.xlsx. They keep every
+# sheet and header as in the sample. The data block of each list sheet (表1
+# sites, 表2, 表3, 表4, 表5, 表7, 表8) is repeated to the requested row count,
+# with numbers nudged per copy. The fixed-layout summaries (表6.1, 表6.2) stay
+# as they are. Generated files are kept in the builder cache and reused.
+#
+# Every case runs in a fresh process with an empty builder cache, so timings
+# are cold and peak memory belongs to that case alone. Results are written as
+# JSON: compare runs of two commits on the same machine with --compare.
+#
+#   python benchmark_report_builder.py --scales 10 100 1000
+#   python benchmark_report_builder.py --scales 100000 --cases main_with_inputs --timeout 7200
+#   python benchmark_report_builder.py --compare before.json --output after.json
+HELPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.join(HELPERS_DIR, '..', 'RB_GUI_package')
+CLASSIFIER_DIR = os.path.join(HELPERS_DIR, '..', 'classifier')
+REPO_ROOT = os.path.join(HELPERS_DIR, '..', '..')
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, CLASSIFIER_DIR)
+
+from build_instrumentation import peak_rss  # light: no backend imports
+from report_template import CACHE_DIR
+
+SAMPLE_WORKBOOK = os.path.join(REPO_ROOT, 'template', 'excel_input.xlsx')
+TEMPLATE_DOCX = os.path.join(REPO_ROOT, 'template', 'template.docx')
+BENCHMARK_DIR = os.path.join(CACHE_DIR, 'benchmarks')
+DEFAULT_SCALES = [10, 100, 1000]
+DEFAULT_TIMEOUT = 3600
+COMPARE_TOLERANCE = 0.2
+
+# Bump when generate_workbook changes what it writes
+GENERATOR_VERSION = 1
+# Sheet -> first data row; the data block runs to the first empty row
+SCALED_SHEETS = {
+    '表1.基本資料': 18,
+    '表2.排放源鑑別': 4,
+    '表3.活動數據': 4,
+    '表4.定量盤查': 4,
+    '表5.排放係數': 4,
+    '表7.數據品質分析': 4,
+    '表8.不確定分析': 4,
+}
+ROW_SHEETS = ['表1.基本資料', '表2.排放源鑑別', '表3.活動數據', '表8.不確定分析']
+EMISSION_FACTOR_SHEET = '表5.排放係數'
+ACTIVITY_SHEET = '表3.活動數據'
+
+
+# ===== Synthetic inventories =====
+def _write_row(target, row, copy_number):
+    from openpyxl.cell import WriteOnlyCell
+
+    cells = []
+    for cell in row:
+        value = cell.value
+        if value is None:
+            cells.append(None)
+            continue
+        if copy_number and isinstance(value, float):
+            value = round(value * (1 + copy_number % 10 / 100), 10)
+        out = WriteOnlyCell(target, value=value)
+        out.number_format = cell.number_format
+        cells.append(out)
+    target.append(cells)
+
+
+def generate_workbook(sample_path, rows, output_path):
+    # Copy of sample_path whose list sheets hold `rows` data rows each
+    from openpyxl import Workbook, load_workbook
+
+    source = load_workbook(sample_path, read_only=True, data_only=True)
+    book = Workbook(write_only=True)
+    try:
+        for worksheet in source.worksheets:
+            worksheet.reset_dimensions()
+            target = book.create_sheet(worksheet.title)
+            sheet_rows = list(worksheet.iter_rows())
+            start = SCALED_SHEETS.get(worksheet.title)
+            if start is None:
+                for row in sheet_rows:
+                    _write_row(target, row, 0)
+                continue
+            end = start - 1
+            while end < len(sheet_rows) and any(cell.value is not None for cell in sheet_rows[end]):
+                end += 1
+            block = sheet_rows[start - 1:end]
+            for row in sheet_rows[:start - 1]:
+                _write_row(target, row, 0)
+            for i in range(rows if block else 0):
+                _write_row(target, block[i % len(block)], i // len(block))
+            for row in sheet_rows[end:]:
+                _write_row(target, row, 0)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        book.save(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        source.close()
+    return output_path
+
+
+def synthetic_workbook(rows, sample_path=SAMPLE_WORKBOOK):
+    # Cached synthetic inventory with `rows` data rows per list sheet
+    with open(sample_path, 'rb') as f:
+        sample_hash = hashlib.sha256(f.read()).hexdigest()[:12]
+    folder = os.path.join(BENCHMARK_DIR, 'workbooks')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"inventory_{rows}_{sample_hash}_v{GENERATOR_VERSION}.xlsx")
+    if not os.path.exists(path):
+        generate_workbook(sample_path, rows, path)
+    return path
+
+
+# ===== Cases =====
+# Each case gets the context, does its (untimed) setup and returns the callable
+# that is timed. The callable returns an output file path, or a value whose
+# pickled size is reported as the output size.
+class CaseContext:
+    def __init__(self, excel_path, word_path, workdir, rows):
+        import report_builder
+        from report_plan import DEFAULT_MAPPING_PATH, PLAN_CACHE
+        from report_template import TEMPLATE_CACHE
+
+        self.rb = report_builder
+        self.excel_path = excel_path
+        self.word_path = word_path
+        self.workdir = workdir
+        self.rows = rows
+        self.plan = PLAN_CACHE.get(DEFAULT_MAPPING_PATH, TEMPLATE_CACHE.compiled(word_path))
+
+    def output(self, name):
+        return os.path.join(self.workdir, name)
+
+    def sheet_table(self, sheet_name):
+        # The planned table of a sheet with the most mapped columns
+        tables = [table for table in self.plan.tables if table.sheet == sheet_name]
+        return max(tables, key=lambda table: len(table.cell_mapping))
+
+    def placeholder_values(self):
+        values = {}
+        for sheet_name, items in self.plan.placeholders.items():
+            cells = self.rb.read_excel_cells(self.excel_path, sheet_name, [cell for _, cell in items])
+            values.update((token, cells[cell]) for token, cell in items)
+        return values
+
+
+def case_format_value(ctx):
+    snapshot = ctx.rb.WorkbookSnapshot(ctx.excel_path, cache=None)
+    cells = [cell for row in snapshot[ACTIVITY_SHEET].iter_rows() for cell in row]
+    return lambda: [ctx.rb.format_value(cell) for cell in cells]
+
+
+def case_read_excel_data(ctx):
+    return lambda: {sheet: ctx.rb.read_excel_data(ctx.excel_path, sheet) for sheet in ROW_SHEETS}
+
+
+def case_read_excel_data_pandas(ctx):
+    return lambda: ctx.rb.read_excel_data_pandas(ctx.excel_path, EMISSION_FACTOR_SHEET)
+
+
+def case_read_excel_cell(ctx):
+    sheet_name, items = next(iter(ctx.plan.placeholders.items()))
+    return lambda: ctx.rb.read_excel_cell(ctx.excel_path, sheet_name, items[0][1])
+
+
+def case_read_excel_cells(ctx):
+    return ctx.placeholder_values
+
+
+def case_extract_sheet(ctx):
+    snapshot = ctx.rb.WorkbookSnapshot(ctx.excel_path, cache=None)
+    sheets = {sheet: snapshot[sheet] for sheet in ROW_SHEETS}  # parsed during setup
+    specs = ctx.rb.SHEET_EXTRACT_SPECS
+    return lambda: {sheet: ctx.rb.extract_sheet(sheets[sheet], specs[sheet]) for sheet in ROW_SHEETS}
+
+
+def case_reshape_emission_factors(ctx):
+    snapshot = ctx.rb.WorkbookSnapshot(ctx.excel_path, cache=None)
+    frame = snapshot.dataframe(EMISSION_FACTOR_SHEET, header=2)
+    return lambda: ctx.rb.reshape_emission_factors(frame)
+
+
+def case_add_table_row(ctx):
+    from docx import Document
+
+    table = Document(ctx.word_path).tables[0]
+
+    def run():
+        for _ in range(ctx.rows):
+            ctx.rb.add_table_row(table)
+        return len(table._tbl.tr_lst)
+    return run
+
+
+def case_compile_replacements(ctx):
+    values = ctx.placeholder_values()
+    return lambda: ctx.rb.compile_replacements(values.items())[1]
+
+
+def case_fill_word_table(ctx):
+    table = ctx.sheet_table('表2.排放源鑑別')
+    data = ctx.rb.read_excel_data(ctx.excel_path, table.sheet)
+    output = ctx.output('fill_word_table.docx')
+
+    def run():
+        ctx.rb.fill_word_table(ctx.word_path, output, table.table, data, table.cell_mapping, table.start_row,
+                               table.group_merge)
+        return output
+    return run
+
+
+def case_merge_cells_in_table_25(ctx):
+    table = ctx.sheet_table(EMISSION_FACTOR_SHEET)
+    data = ctx.rb.read_excel_data_pandas(ctx.excel_path, EMISSION_FACTOR_SHEET)
+    filled = ctx.output('emission_factors_unmerged.docx')
+    ctx.rb.fill_word_table(ctx.word_path, filled, table.table, data, table.cell_mapping, table.start_row)
+    output = ctx.output('merge_cells_in_table_25.docx')
+
+    def run():
+        ctx.rb.merge_cells_in_table_25(filled, output, table.table)
+        return output
+    return run
+
+
+def case_replace_texts_in_word(ctx):
+    values = ctx.placeholder_values()
+    output = ctx.output('replace_texts_in_word.docx')
+
+    def run():
+        ctx.rb.replace_texts_in_word(ctx.word_path, output, values.items())
+        return output
+    return run
+
+
+def case_insert_if_empty_tables(ctx):
+    output = ctx.output('insert_if_empty_tables.docx')
+
+    def run():
+        ctx.rb.insert_if_empty_tables(ctx.word_path, output, ctx.plan.empty_check_tables)
+        return output
+    return run
+
+
+def case_read_sheet_plan(ctx):
+    snapshot = ctx.rb.WorkbookSnapshot(ctx.excel_path, cache=None)
+    return lambda: {sheet.name: ctx.rb.read_sheet_plan(snapshot, sheet) for sheet in ctx.plan.sheets}
+
+
+def case_run_plan(ctx):
+    session = ctx.rb.ReportSession(ctx.word_path)
+    snapshot = ctx.rb.WorkbookSnapshot(ctx.excel_path, cache=None)
+    output = ctx.output('run_plan.docx')
+
+    def run():
+        ctx.rb.run_plan(ctx.plan, session, snapshot)
+        session.save(output)  # for the output size; saving is timed by main_with_inputs too
+        return output
+    return run
+
+
+def case_main_with_inputs(ctx):
+    def run():
+        ctx.rb.main_with_inputs(ctx.excel_path, ctx.word_path, ctx.workdir, 'report.docx', incremental=False)
+        return ctx.output('report.docx')
+    return run
+
+
+def case_main_with_inputs_warm(ctx):
+    # Second full build: template and sheet data come from the caches
+    ctx.rb.main_with_inputs(ctx.excel_path, ctx.word_path, ctx.workdir, 'report.docx', incremental=False)
+    return case_main_with_inputs(ctx)
+
+
+def case_classify_calculation_method(ctx):
+    from calc_method_classifier import classify_calculation_method
+
+    output = ctx.output('classified.xlsx')
+
+    def run():
+        classify_calculation_method(ctx.excel_path, output_path=output)
+        return output
+    return run
+
+
+CASES = {
+    name[len('case_'):]: func for name, func in sorted(globals().items())
+    if name.startswith('case_') and callable(func)
+}
+
+
+# ===== Running =====
+def run_case(case, excel_path, word_path, rows, result_path):
+    # Worker side: one case in this (fresh) process; writes its result as JSON
+    result = {'case': case, 'rows': rows, 'wall_s': None, 'peak_rss_bytes': None, 'peak_rss_delta_bytes': None,
+              'output_bytes': None, 'error': None}
+    with tempfile.TemporaryDirectory(prefix='ghg_bench_') as workdir:
+        try:
+            run = CASES[case](CaseContext(excel_path, word_path, workdir, rows))
+            peak_before = peak_rss()
+            start = time.perf_counter()
+            output = run()
+            result['wall_s'] = time.perf_counter() - start
+            result['peak_rss_bytes'] = peak_rss()
+            if result['peak_rss_bytes'] is not None and peak_before is not None:
+                result['peak_rss_delta_bytes'] = result['peak_rss_bytes'] - peak_before
+            if isinstance(output, str) and os.path.isfile(output):
+                result['output_bytes'] = os.path.getsize(output)
+            else:
+                result['output_bytes'] = len(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def measure(case, excel_path, word_path, rows, timeout):
+    # Driver side: runs the case in a child process with an empty builder cache
+    with tempfile.TemporaryDirectory(prefix='ghg_bench_cache_') as cache_dir:
+        result_path = os.path.join(cache_dir, 'result.json')
+        env = dict(os.environ, GHG_REPORT_BUILDER_CACHE=cache_dir)
+        command = [sys.executable, os.path.abspath(__file__), '--run-case', case, '--excel', excel_path,
+                   '--word', word_path, '--rows', str(rows), '--result', result_path]
+        try:
+            completed = subprocess.run(command, env=env, cwd=PACKAGE_DIR, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {'case': case, 'rows': rows, 'error': f"timed out after {timeout}s"}
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            lines = completed.stderr.strip().splitlines()
+            return {'case': case, 'rows': rows, 'error': lines[-1] if lines else f"exit code {completed.returncode}"}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _best(results):
+    # Fastest successful repeat, or the first failure
+    ok = [r for r in results if not r.get('error')]
+    return min(ok, key=lambda r: r['wall_s']) if ok else results[0]
+
+
+def run_benchmarks(scales, cases, word_path, repeat=1, timeout=DEFAULT_TIMEOUT, on_result=None):
+    results = []
+    for rows in scales:
+        excel_path = synthetic_workbook(rows)
+        for case in cases:
+            result = _best([measure(case, excel_path, word_path, rows, timeout) for _ in range(repeat)])
+            result['input_bytes'] = os.path.getsize(excel_path)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                    'cpu_count': os.cpu_count(), 'python': platform.python_version()},
+        'excel_backend': os.environ.get('GHG_REPORT_BUILDER_EXCEL_BACKEND') or 'openpyxl',
+        'sheet_pool': os.environ.get('GHG_REPORT_BUILDER_SHEET_POOL') or 'thread',
+        'table_render': os.environ.get('GHG_REPORT_BUILDER_TABLE_RENDER') or 'serial',
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=COMPARE_TOLERANCE):
+    # Lines for every (case, rows) in both runs; slowdowns beyond tolerance are flagged
+    previous = {(r['case'], r['rows']): r for r in baseline.get('results', []) if not r.get('error')}
+    lines, regressions = [], 0
+    for result in current['results']:
+        before = previous.get((result['case'], result['rows']))
+        if before is None or result.get('error'):
+            continue
+        ratio = result['wall_s'] / before['wall_s'] if before['wall_s'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        lines.append(f"{result['case']:28} {result['rows']:>7}  {before['wall_s']:9.3f}s -> "
+                     f"{result['wall_s']:9.3f}s  x{ratio:5.2f}{flag}")
+    return lines, regressions
+
+
+def _format_result(result):
+    if result.get('error'):
+        return f"{result['case']:28} {result['rows']:>7}  ERROR {result['error']}"
+    peak = result['peak_rss_bytes'] / 1024 / 1024 if result['peak_rss_bytes'] is not None else float('nan')
+    output = result['output_bytes'] / 1024
+    return f"{result['case']:28} {result['rows']:>7}  {result['wall_s']:9.3f}s  peak {peak:8.1f} MB  out {output:9.1f} KB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark report_builder on synthetic inventories.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help=f"Data rows per list sheet (default: {' '.join(map(str, DEFAULT_SCALES))})")
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=sorted(CASES),
+                        help="Cases to run (default: all)")
+    parser.add_argument('--template', default=TEMPLATE_DOCX, help="Word template (default: template/template.docx)")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per case; the fastest is kept")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT, help="Seconds allowed per case run")
+    parser.add_argument('--output', default=None,
+                        help="Results JSON (default: <builder cache>/benchmarks/<timestamp>-<commit>.json)")
+    parser.add_argument('--compare', default=None, help="Earlier results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=COMPARE_TOLERANCE,
+                        help="Slowdown flagged by --compare (default: 0.2 = 20%%)")
+    parser.add_argument('--generate-only', action='store_true',
+                        help="Only create (or reuse) the synthetic workbooks and print their paths")
+    # Worker mode, used by measure()
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--excel', help=argparse.SUPPRESS)
+    parser.add_argument('--word', help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        run_case(args.run_case, args.excel, args.word, args.rows, args.result)
+        return 0
+    if args.generate_only:
+        for rows in args.scales:
+            print(synthetic_workbook(rows))
+        return 0
+
+    results = run_benchmarks(args.scales, args.cases, os.path.abspath(args.template), args.repeat, args.timeout,
+                             on_result=lambda result: print(_format_result(result), flush=True))
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{results['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            lines, regressions = compare(results, json.load(f), args.tolerance)
+        for line in lines:
+            print(line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# Startup-time benchmark for the GUI and the report_builder backend, to catch
+# import-time regressions:
+#   - `python -X importtime -c "import report_builder"`: total and the slowest
+#     top-level imports (and whether pandas sneaked back into the import chain)
+#   - time to first window / to backend ready: report_builder_gui.pyw is started
+#     with GHG_REPORT_BUILDER_STARTUP_PROBE set and prints both milestones
+#
+#   python startup_benchmark.py [--repeat 5] [--json out.json] [--baseline old.json]
+# With --baseline the exit code is 1 when a timing is more than --tolerance slower.
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RB_GUI_package')
+GUI_SCRIPT = os.path.join(PACKAGE_DIR, 'report_builder_gui.pyw')
+STARTUP_PROBE_ENV = 'GHG_REPORT_BUILDER_STARTUP_PROBE'
+GUI_TIMEOUT = 120
+
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def interpreter_startup(repeat):
+    # Seconds for `python -c pass`, the floor under every other number
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def import_breakdown(module, repeat):
+    # ([total seconds per run], {top-level import: best cumulative seconds}, modules imported)
+    totals, cumulative, modules = [], {}, set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=PACKAGE_DIR, capture_output=True, text=True, check=True,
+        )
+        total = 0
+        children = {}  # direct imports of the next top-level line (children are listed first)
+        for line in result.stderr.splitlines():
+            match = _IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            cumulative_us, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+            modules.add(name)
+            if indent == 3:
+                children[name] = cumulative_us
+            elif indent == 1:
+                if name == module:
+                    total = cumulative_us
+                    for child, us in children.items():
+                        cumulative[child] = min(cumulative.get(child, us), us)
+                children = {}
+        totals.append(total / 1e6)
+    return totals, {name: us / 1e6 for name, us in cumulative.items()}, modules
+
+
+def gui_startup(repeat):
+    # ([seconds to first window], [seconds to backend ready]) from process start,
+    # or a reason string when the GUI cannot start (e.g. no display)
+    env = dict(os.environ, **{STARTUP_PROBE_ENV: '1'})
+    windows, backends = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, GUI_SCRIPT], cwd=PACKAGE_DIR, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        milestones = {}
+        for line in process.stdout:
+            milestones[line.strip()] = time.perf_counter() - start
+            if 'backend' in milestones:
+                break
+        try:
+            _, stderr = process.communicate(timeout=GUI_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+        if 'window' not in milestones or 'backend' not in milestones:
+            lines = stderr.strip().splitlines()
+            return lines[-1] if lines else f"GUI exited with code {process.returncode}"
+        windows.append(milestones['window'])
+        backends.append(milestones['backend'])
+    return windows, backends
+
+
+def _summary(times):
+    return {'min': min(times), 'median': statistics.median(times)}
+
+
+def run(repeat, top):
+    results = {'python': sys.version.split()[0], 'repeat': repeat, 'timings': {}}
+    results['timings']['interpreter'] = _summary(interpreter_startup(repeat))
+
+    totals, cumulative, modules = import_breakdown('report_builder', repeat)
+    results['timings']['import report_builder'] = _summary(totals)
+    results['slowest_imports'] = dict(sorted(cumulative.items(), key=lambda item: -item[1])[:top])
+    results['pandas_imported'] = 'pandas' in modules
+
+    gui = gui_startup(repeat)
+    if isinstance(gui, str):
+        results['gui_skipped'] = gui
+    else:
+        results['timings']['first window'] = _summary(gui[0])
+        results['timings']['backend ready'] = _summary(gui[1])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Timings more than tolerance slower than the baseline's medians
+    regressions = []
+    for name, timing in results['timings'].items():
+        previous = baseline.get('timings', {}).get(name)
+        if previous and timing['median'] > previous['median'] * (1 + tolerance):
+            regressions.append(f"{name}: {previous['median'] * 1000:.0f} ms -> {timing['median'] * 1000:.0f} ms")
+    if results['pandas_imported'] and not baseline.get('pandas_imported', False):
+        regressions.append("import report_builder now imports pandas")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure GUI and backend startup time.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (default: 5)")
+    parser.add_argument('--top', type=int, default=10, help="Slowest direct imports to list (default: 10)")
+    parser.add_argument('--json', dest='json_path', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Earlier --json output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown against the baseline (default: 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.top)
+    for name, timing in results['timings'].items():
+        print(f"{name:24} min {timing['min'] * 1000:7.0f} ms   median {timing['median'] * 1000:7.0f} ms")
+    if 'gui_skipped' in results:
+        print(f"{'first window':24} skipped: {results['gui_skipped']}")
+    print(f"pandas imported by report_builder: {'yes' if results['pandas_imported'] else 'no'}")
+    print("slowest direct imports of report_builder:")
+    for name, seconds in results['slowest_imports'].items():
+        print(f"  {name:40} {seconds * 1000:7.0f} ms")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import glob
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+# Checks that the streaming lxml backend (RB_GUI_package/xlsx_stream.py) reads
+# exactly what the openpyxl backend reads, and how much CPU and memory each
+# needs for the sheets the report plan uses.
+#
+#   python xlsx_backend_check.py [workbook.xlsx | folder ...]   (default: template/*.xlsx)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RB_GUI_package'))
+from report_builder import WorkbookSnapshot, read_excel_cells, read_sheet_plan
+from report_plan import DEFAULT_MAPPING_PATH, PLAN_CACHE
+from report_template import TEMPLATE_CACHE
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+DEFAULT_SAMPLES = os.path.join(REPO_ROOT, 'template', '*.xlsx')
+# Placeholders are planned against the template, so their cells are checked too
+DEFAULT_TEMPLATE = os.path.join(REPO_ROOT, 'template', 'template.docx')
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return type(a) is type(b) and a == b
+
+
+def _cell_key(cell):
+    return cell.value, cell.data_type, cell.number_format
+
+
+def compare_cells(excel_path):
+    # Every cell of every sheet: value, data type and number format
+    mismatches = []
+    with WorkbookSnapshot(excel_path, cache=None, backend='openpyxl') as reference, \
+            WorkbookSnapshot(excel_path, cache=None, backend='lxml') as streamed:
+        for sheet_name in reference.sheetnames:
+            expected = list(reference[sheet_name].iter_rows())
+            actual = list(streamed[sheet_name].iter_rows())
+            if len(expected) != len(actual):
+                mismatches.append(f"{sheet_name}: {len(expected)} rows vs {len(actual)}")
+                continue
+            for row_number, (left, right) in enumerate(zip(expected, actual), start=1):
+                if len(left) != len(right):
+                    mismatches.append(f"{sheet_name}!{row_number}: {len(left)} cells vs {len(right)}")
+                    continue
+                for column, (a, b) in enumerate(zip(left, right), start=1):
+                    if not all(_same(x, y) for x, y in zip(_cell_key(a), _cell_key(b))):
+                        mismatches.append(f"{sheet_name}!R{row_number}C{column}: {_cell_key(a)} vs {_cell_key(b)}")
+    return mismatches
+
+
+def read_plan(excel_path, backend, plan):
+    # What a build reads from the workbook: every planned sheet and placeholder cell
+    results = {}
+    with WorkbookSnapshot(excel_path, cache=None, backend=backend) as workbook:
+        for sheet_plan in plan.sheets:
+            try:
+                results[sheet_plan.name] = read_sheet_plan(workbook, sheet_plan)
+            except Exception as e:
+                results[sheet_plan.name] = f"{type(e).__name__}: {e}"
+        for sheet_name, items in plan.placeholders.items():
+            if sheet_name in workbook:
+                results[f"cells:{sheet_name}"] = read_excel_cells(workbook, sheet_name, [cell for _, cell in items])
+    return results
+
+
+def measure(excel_path, backend, plan, repeat=3):
+    # (best CPU seconds, peak traced MB) of read_plan
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        read_plan(excel_path, backend, plan)
+        cpu.append(time.process_time() - start)
+    tracemalloc.start()
+    read_plan(excel_path, backend, plan)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(cpu), peak / 1024 / 1024
+
+
+def main(argv):
+    paths = []
+    for arg in argv or [DEFAULT_SAMPLES]:
+        if os.path.isdir(arg):
+            paths.extend(sorted(glob.glob(os.path.join(arg, '*.xlsx'))))
+        else:
+            paths.extend(sorted(glob.glob(arg)) or [arg])
+    template = TEMPLATE_CACHE.compiled(DEFAULT_TEMPLATE) if os.path.exists(DEFAULT_TEMPLATE) else None
+    plan = PLAN_CACHE.get(DEFAULT_MAPPING_PATH, template)
+    failed = False
+    for path in paths:
+        print(os.path.basename(path))
+        mismatches = compare_cells(path)
+        for line in mismatches[:20]:
+            print(f"  cell mismatch {line}")
+        if read_plan(path, 'openpyxl', plan) != read_plan(path, 'lxml', plan):
+            mismatches.append('plan')
+            print("  plan readers differ")
+        failed = failed or bool(mismatches)
+        print(f"  {'SAME' if not mismatches else f'{len(mismatches)} DIFFERENCES'}")
+        for backend in ('openpyxl', 'lxml'):
+            cpu, peak = measure(path, backend, plan)
+            print(f"  {backend:8} cpu {cpu * 1000:7.1f} ms  peak {peak:6.1f} MB")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))